@@ -1,23 +1,22 @@
-from graph_io import load_graph
+from graph_io import SharedGraphs, load_graph, open_graph_file
 from graph_iso import GraphIso
+from result_cache import ResultCache
 from enum import Enum
 import multiprocessing
 import time
 
 
-def basicAut(file_name, graphs):
+def basicAut(file_name, graphs, processes=1, cache=None, pool=None):
     output = file_name + ':\n{:<30}#Aut:\n'.format('Graph:')
     graph_ids = assign_ids(graphs)
     for graph in graphs:
-        pair = [graph, graph.deep_copy()]
-        groups = GraphIso(pair).group(with_count=True)
-        count = 0 if len(groups) == 0 else groups[0].count
+        count = GraphIso([graph], cache).count(graph, processes, pool)
         output += '{:<30}{}\n'.format(str(graph_ids[graph]) + ':', count)
     print(output)
 
 
-def basicGI(file_name, graphs):
-    groups = GraphIso(graphs).group()
+def basicGI(file_name, graphs, processes=1, cache=None, pool=None):
+    groups = GraphIso(graphs, cache).group(processes=processes, pool=pool)
     format_groups(graphs, groups)
     output = file_name + ':\nEquivalence classes:\n'
     for group in groups:
@@ -25,8 +24,8 @@ def basicGI(file_name, graphs):
     print(output)
 
 
-def basicGIAut(file_name, graphs):
-    groups = GraphIso(graphs).group(with_count=True)
+def basicGIAut(file_name, graphs, processes=1, cache=None, pool=None):
+    groups = GraphIso(graphs, cache).group(with_count=True, processes=processes, pool=pool)
     format_groups(graphs, groups)
     output = file_name + ':\n'
     output += '{:<30}#Aut:\n'.format('Equivalence classes:')
@@ -42,10 +41,22 @@ class Basic(Enum):
 
 
 def exec_file(args):
-    name, consumer = args
-    with open(name) as f:
+    name, consumer, processes, cache_path = args
+    with open_graph_file(name) as f:
         graphs = load_graph(f, read_list=True)[0]
-        consumer(name, graphs)
+
+    # one pool serves all graphs of the file
+    pool = SharedGraphs.pool(processes) if processes != 1 else None
+    try:
+        if cache_path is None:
+            consumer(name, graphs, processes, pool=pool)
+        else:
+            with ResultCache(cache_path) as cache:
+                consumer(name, graphs, processes, cache, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
 
 def format_groups(graphs, groups):
@@ -63,12 +74,20 @@ def assign_ids(graphs):
     return graph_ids
 
 
-def run(files):
+def run(files, cache_path=None):
+    """
+    Runs every (file name, Basic consumer) pair. With `cache_path`, results are kept
+    in a ResultCache at that path, so later runs only work on new or changed graphs.
+    """
     start_time = time.time()
     print()
 
-    with multiprocessing.Pool() as pool:
-        pool.map(exec_file, files)
+    # a single file uses all processes within itself instead
+    if len(files) == 1:
+        exec_file(files[0] + (None, cache_path))
+    else:
+        with multiprocessing.Pool() as pool:
+            pool.map(exec_file, [file + (1, cache_path) for file in files])
 
     total_time = time.time() - start_time
     print('total time:\t%.2fs\n' % total_time)
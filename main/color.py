@@ -1,27 +1,139 @@
-from collections import deque
-from graph import Graph
+from random import Random
 
 
-class Color(object):
-    def __init__(self, label):
-        self.label = label
-        self.inQueue = False
-        self.states = deque()
+# pseudo-random weight of each cell (by its start), the same in every run
+weights = []
+weight_source = Random(0)
+
+
+class Partition(object):
+    """
+    Ordered partition of vertex ids into cells (colors), stored in a single array.
+    The vertices of a cell occupy elements[start:end] and the cell is labelled by its start.
+    Given the graph of each vertex, it keeps a signature of the colour histogram of every
+    graph: the sum of the weights of the cells of its vertices. Graphs with the same numbers
+    of vertices in every cell have the same signature (and others almost never do).
+
+    partition.elements              vertex ids ordered by cell
+    partition.position              index of each vertex in partition.elements
+    partition.cell_of               cell (start) of each vertex
+    partition.cell_end              end of each cell, indexed by its start
+    partition.in_queue              whether a cell is waiting to be used as a splitter
+    partition.signature             signature of the colour histogram of each graph (if graph_of is given)
+    partition.size                  number of cells
+
+    partition.cells()               returns the starts of all cells in order
+    partition.vertices_of(C)        returns the vertices of a cell
+    partition.move_to_tail(C, V)    moves vertices to the tail of a cell and returns where they start
+    partition.split(C, S)           splits a cell at the given starts of new cells
+    partition.undo(T)               merges back the cells split after the trail had length T
+    """
+
+    def __init__(self, vertices, n: int, graph_of=None, graphs: int = 0):
+        self.elements = list(vertices)
+        self.position = [-1] * n
+        self.cell_of = [0] * n
+        self.cell_end = [0] * len(self.elements)
+        self.in_queue = [False] * len(self.elements)
+        self.trail = []
+        for i, vertex in enumerate(self.elements):
+            self.position[vertex] = i
+        self.size = 0
+        if len(self.elements) > 0:
+            self.cell_end[0] = len(self.elements)
+            self.size = 1
+
+        # every vertex starts in the cell at 0
+        self.graph_of = graph_of
+        self.signature = None
+        if graph_of is not None:
+            while len(weights) < len(self.elements):
+                weights.append(weight_source.getrandbits(64))
+            self.signature = [0] * graphs
+            for vertex in self.elements:
+                self.signature[graph_of[vertex]] += weights[0]
 
     def __len__(self):
-        return len(self.states)
+        return len(self.elements)
+
+    def cells(self):
+        start, size = 0, len(self.elements)
+        while start < size:
+            yield start
+            start = self.cell_end[start]
+
+    def vertices_of(self, cell):
+        return self.elements[cell:self.cell_end[cell]]
+
+    def move_to_tail(self, cell, vertices) -> int:
+        """
+        Swaps the given vertices of a cell to its tail in O(len(vertices)).
+        :return: the index where the moved vertices start
+        """
+        elements, position = self.elements, self.position
+        boundary = self.cell_end[cell]
+        for vertex in vertices:
+            boundary -= 1
+            i = position[vertex]
+            other = elements[boundary]
+            elements[i] = other
+            position[other] = i
+            elements[boundary] = vertex
+            position[vertex] = boundary
+        return boundary
+
+    def split(self, cell, starts):
+        """
+        Splits a cell into consecutive cells beginning at `cell` and at each of `starts`.
+        Only vertices of the new cells are relabelled, the first part keeps its label.
+        """
+        if len(starts) == 0:
+            return
+        elements, cell_of, cell_end = self.elements, self.cell_of, self.cell_end
+        graph_of, signature = self.graph_of, self.signature
+        end = cell_end[cell]
+        for i in range(len(starts) - 1, -1, -1):
+            start = starts[i]
+            cell_end[start] = end
+            if graph_of is None:
+                for j in range(start, end):
+                    cell_of[elements[j]] = start
+            else:
+                weight = weights[start] - weights[cell]
+                for j in range(start, end):
+                    vertex = elements[j]
+                    cell_of[vertex] = start
+                    signature[graph_of[vertex]] += weight
+            end = start
+        cell_end[cell] = end
+        self.size += len(starts)
+        self.trail.append((cell, starts))
+
+    def undo(self, mark: int):
+        """
+        Reverts the splits recorded on the trail after `mark`, latest first,
+        in time proportional to the size of the cells merged back.
+        """
+        elements, cell_of, cell_end = self.elements, self.cell_of, self.cell_end
+        graph_of, signature = self.graph_of, self.signature
+        trail = self.trail
+        while len(trail) > mark:
+            cell, starts = trail.pop()
+            end = cell_end[starts[-1]]
+            if graph_of is None:
+                for j in range(starts[0], end):
+                    cell_of[elements[j]] = cell
+            else:
+                for j in range(starts[0], end):
+                    vertex = elements[j]
+                    signature[graph_of[vertex]] += weights[cell] - weights[cell_of[vertex]]
+                    cell_of[vertex] = cell
+            cell_end[cell] = end
+            self.size -= len(starts)
 
-    def __str__(self):
-        return str(self.label)
 
-    def copy(self, graphs: set[Graph]):
-        copy = Color(self.label)
-        copy.inQueue = self.inQueue
-        copy.states = deque(v for v in self.states if v.graph in graphs)
-        return copy
-    
 class ColorGroup(object):
     def __init__(self, graphs, colors, discrete):
         self.graphs = graphs
         self.colors = colors
-        self.discrete = discrete
\ No newline at end of file
+        self.discrete = discrete
@@ -1,4 +1,5 @@
 from color import ColorGroup
+from compact_graph import CompactGraph
 from graph import Graph
 
 
@@ -7,12 +8,13 @@ class GraphColors(object):
     Usage of GraphColors class:
     colors = GraphColors([G1, G2, ...])
 
-    colors.all                      colors for each vertex by graph
-    colors.near                     neighboring colors for each vertex 
+    colors.all                      colors for each vertex id (see colors.compact)
+    colors.near                     neighboring colors for each vertex id
     colors.next                     next color to be assigned
 
     colors.refine()                 refines the coloring
     colors.reset()                  resets colors to the initial state
+    colors.reset(values)            resets colors by the degree and the given value of each vertex
     colors.group()                  groups graphs with the same coloring
     colors.count()                  counts the number of repeating colors
     colors.assign(V, C)             assigns a color (C) to a vertex (V)
@@ -20,41 +22,44 @@ class GraphColors(object):
     colors.copy([G1, G2, ...])      returns a copy of the colors for the given graphs
     """
 
-    def __init__(self, graphs: list[Graph]):
-        self.graphs = graphs
+    def __init__(self, graphs: list[Graph], compact: CompactGraph = None):
+        self.graphs = list(graphs)
+        self.compact = compact if compact is not None else CompactGraph.from_graphs(self.graphs)
+        self.index = {graph: i for i, graph in enumerate(self.graphs)}
+        self.active = list(range(len(self.graphs)))
 
     def __str__(self):
         output = ''
-        for graph_id, graph in enumerate(self.all):
+        for graph_id in self.active:
             output += '\nGraph {}:\n'.format(graph_id)
-            for vertex, color in self.all[graph].items():
-                output += 'Vertex {}: {}\n'.format(vertex.label, color)
+            for vertex in self.compact.vertices_of(graph_id):
+                output += 'Vertex {}: {}\n'.format(vertex, self.all[vertex])
         return output
 
     def vertices_of(self, graph, color):
         """
         Returns a list of vertices with a given color.
         """
-        return [vertex for vertex in graph.vertices
-                if self.all[graph][vertex] == color]
+        return [vertex for vertex in self.compact.vertices_of(self.index[graph])
+                if self.all[vertex] == color]
 
     def first_vertex_of(self, graph, color):
         """
         Returns the first vertex with a given color.
         """
-        for vertex in graph.vertices:
-            if self.all[graph][vertex] == color:
+        for vertex in self.compact.vertices_of(self.index[graph]):
+            if self.all[vertex] == color:
                 return vertex
 
-    def reset(self):
+    def reset(self, values=None):
         """
-        Resets to the initial state by setting colors by vertex degree 
-        and resetting the neighboring colors.
+        Resets to the initial state by setting colors by vertex degree (and the given values,
+        e.g. vertex invariants indexed by vertex id) and resetting the neighboring colors.
         """
-        self.all = {graph: {} for graph in self.graphs}
-        self.near = {}
+        self.all = [-1] * self.compact.n
+        self.near = [None] * self.compact.n
         self.next = 0
-        self.__set_by_degree()
+        self.__set_by_degree(values)
         self.__reset_near()
         return self
 
@@ -62,20 +67,22 @@ class GraphColors(object):
         """
         Returns a copy of the colors for the given graphs.
         """
-        colors = GraphColors(graphs)
+        colors = GraphColors(self.graphs, self.compact)
+        colors.active = sorted(self.index[graph] for graph in graphs)
         colors.next = self.next
-        colors.all = {graph: self.all[graph].copy() for graph in graphs}
-        colors.near = {vertex: self.near[vertex].copy()
-                       for graph in graphs
-                       for vertex in graph.vertices}
+        colors.all = self.all.copy()
+        colors.near = self.near.copy()
+        for graph_id in colors.active:
+            for vertex in self.compact.vertices_of(graph_id):
+                colors.near[vertex] = self.near[vertex].copy()
         return colors
 
     def assign(self, vertex, color):
         """
         Assigns a color to a vertex and updates its neighbors.
         """
-        self.all[vertex.graph][vertex] = color
-        for neighbor in vertex.neighbours:
+        self.all[vertex] = color
+        for neighbor in self.compact.neighbours(vertex):
             near = self.near[neighbor]
             near[color] = near.get(color, 0) + 1
 
@@ -86,34 +93,30 @@ class GraphColors(object):
         A set is included if the number of colors is the same for both graphs.
         e.g. [([G1, G2], {0: 2, 1: 2}, False), ([G3], {0: 3}, True)]
         """
-        # group graphs with the same number of colors
-        groups = []
+        # group graphs with the same number of colors (by the histogram as a hashable set)
+        groups = {}
         for graph, colors in self.count().items():
-            new_group = True
-            # check if such a group already exists
-            for group in groups:
-                if group.colors == colors:
-                    group.graphs.append(graph)
-                    new_group = False
-                    break
-            # if not, create a new group
-            if new_group:
+            key = frozenset(colors.items())
+            if key in groups:
+                groups[key].graphs.append(graph)
+            else:
                 discrete = all(count == 1 for count in colors.values())
-                groups.append(ColorGroup([graph], colors, discrete))
+                groups[key] = ColorGroup([graph], colors, discrete)
 
         # filter out groups with only one graph
-        return [group for group in groups if len(group.graphs) > 1]
+        return [group for group in groups.values() if len(group.graphs) > 1]
 
-    def count(self) -> list[tuple[int, dict[int: int]]]:
+    def count(self) -> dict[Graph, dict[int, int]]:
         """
         Counts the number of repeating colors.
         e.g. { 0: 3 } means that color '0' appeared 3 times
         """
         count = {}
-        for graph, colors in self.all.items():
+        for graph_id in self.active:
             graph_count = {}
-            count[graph] = graph_count
-            for color in colors.values():
+            count[self.graphs[graph_id]] = graph_count
+            for vertex in self.compact.vertices_of(graph_id):
+                color = self.all[vertex]
                 graph_count[color] = graph_count.get(color, 0) + 1
         return count
 
@@ -122,9 +125,13 @@ class GraphColors(object):
         Executes color refinement algorithm by updating colors based on the uniqueness of 
         colors in vicinity. The algorithm repeats until there are no longer updates.
         """
+        compact = self.compact
+        colors = self.all
+        vertices = [vertex for graph_id in self.active
+                    for vertex in compact.vertices_of(graph_id)]
+
         # set all vertices to be iterated for the 1-st cycle
-        colors_to_update = set(
-            colors[vertex] for graph, colors in self.all.items() for vertex in graph)
+        colors_to_update = set(colors[vertex] for vertex in vertices)
         updated_vertices = set()
 
         while True:
@@ -133,12 +140,10 @@ class GraphColors(object):
             color_vicinity = {}
             new_mapping = {}
             updated_vertices.clear()
-            for graph, colors in self.all.items():
-                for vertex in graph:
-                    color = colors[vertex]
-                    if color in colors_to_update:
-                        if self.__update(vertex, color_vicinity, new_mapping):
-                            updated_vertices.add(vertex)
+            for vertex in vertices:
+                if colors[vertex] in colors_to_update:
+                    if self.__update(vertex, color_vicinity, new_mapping):
+                        updated_vertices.add(vertex)
 
             # finish if there are no updated vertices,
             if len(updated_vertices) == 0:
@@ -148,9 +153,8 @@ class GraphColors(object):
             # and set their neighbors to be updated in the next cycle
             colors_to_update.clear()
             for vertex in updated_vertices:
-                colors = self.all[vertex.graph]
                 new_color = colors[vertex]
-                for neighbor in vertex.neighbours:
+                for neighbor in compact.neighbours(vertex):
                     near = self.near[neighbor]
                     near[new_color] = near.get(new_color, 0) + 1
                     colors_to_update.add(colors[neighbor])
@@ -163,8 +167,7 @@ class GraphColors(object):
         :return: whether the color has changed
         """
         near = self.near[vertex]
-        colors = self.all[vertex.graph]
-        color = colors[vertex]
+        color = self.all[vertex]
 
         if color not in vicinity:
             vicinity[color] = near
@@ -176,40 +179,42 @@ class GraphColors(object):
         if color in new_mapping:
             for new_color in new_mapping[color]:
                 if vicinity[new_color] == near:
-                    colors[vertex] = new_color
+                    self.all[vertex] = new_color
                     return True
             new_mapping[color].append(self.next)
         else:
             new_mapping[color] = [self.next]
 
-        colors[vertex] = self.next
+        self.all[vertex] = self.next
         vicinity[self.next] = near
         self.next += 1
         return True
 
-    def __set_by_degree(self):
+    def __set_by_degree(self, values=None):
         """
-        Assigns colors based on a vertex degree.
+        Assigns colors based on a vertex degree (and value, if given).
         (for each new degree, the color is incremented)
         """
         degrees = {}
-        for graph in self.all:
-            for vertex in graph.vertices:
-                degree = len(vertex.incidence)
+        for graph_id in self.active:
+            for vertex in self.compact.vertices_of(graph_id):
+                degree = self.compact.degrees[vertex]
+                if values is not None:
+                    degree = degree, values[vertex]
                 if degree not in degrees:
                     degrees[degree] = self.next
                     self.next += 1
-                self.all[graph][vertex] = degrees[degree]
+                self.all[vertex] = degrees[degree]
 
     def __reset_near(self):
         """
         Counts the number of neighboring colors of all vertexes.
         e.g. { 2: 3 } means that vertex with color '2' has 3 neighbours
         """
-        for graph in self.all:
-            for vertex in graph:
+        for graph_id in self.active:
+            for vertex in self.compact.vertices_of(graph_id):
                 near = {}
-                for neighbor in vertex.neighbours:
-                    color = self.all[vertex.graph][neighbor]
+                for neighbor in self.compact.neighbours(vertex):
+                    color = self.all[neighbor]
                     near[color] = near.get(color, 0) + 1
                 self.near[vertex] = near
@@ -1,5 +1,6 @@
 from collections import deque
-from color import Color, ColorGroup
+from color import ColorGroup, Partition
+from compact_graph import CompactGraph
 from graph import Graph
 
 
@@ -7,130 +8,272 @@ class GraphFastRef:
     """
     Usage of GraphFastRefinement class:
     fastRef = GraphFastRefinement([G1, G2, ...])
-    fastRef.initial_colouring()      defines the base colouring: uniform with a second colour with the vertices of smallest degree
+    fastRef.reset()                  defines the base colouring: uniform
+    fastRef.reset(values)            defines the base colouring: one colour for each value of a vertex
+    fastRef.split_by(values)         splits every colour by the values of its vertices
     fastRef.refine()                 refines until queue is empty (that is graph is stable)
+    fastRef.refine(pair=True)        refines, but stops as soon as the two graphs are unbalanced
+    fastRef.balanced()               returns whether the two graphs have the same colour histogram
+    fastRef.individualise([x, y])    moves the vertices to a new colour of their own
+    fastRef.mark()                   returns a mark of the current colouring
+    fastRef.undo(mark)               reverts all changes made after the mark
+
+    Vertices are referred to by their integer ids in `fastRef.compact`, colours are cells
+    of `fastRef.partition` labelled by their start. A split cell puts all but its largest
+    part in the queue, so refinement takes O((n + m) log n). With more than one graph, the
+    partition keeps a signature of the colour histogram of every graph, which `group()` uses
+    to bucket the graphs instead of comparing their histograms with each other.
+
+    A pair of graphs with different histograms has no isomorphism that agrees with the
+    colouring, which stays so under further refinement. With `pair=True` the signatures are
+    compared after every split, and refinement stops (leaving the colouring unstable, to be
+    undone) once they differ. Equal signatures do not prove the histograms equal.
     """
 
-    def __init__(self, graphs: set[Graph]):
-        self.graphs = graphs
+    def __init__(self, graphs: list[Graph], compact: CompactGraph = None):
+        self.graphs = list(graphs)
+        self.compact = compact if compact is not None else CompactGraph.from_graphs(self.graphs)
+        self.index = {graph: i for i, graph in enumerate(self.graphs)}
+        self.active = set(range(len(self.graphs)))
         self.queue = deque([])
 
-    def reset(self):
-        self.colors = {}
-        self.labels = {}
-        self.next = 0
-        self.neighbours = {}
+    def reset(self, values=None):
+        """
+        Defines the base colouring, uniform or by the given values (see split_by).
+        """
+        vertices = []
+        for i in sorted(self.active):
+            vertices.extend(self.compact.vertices_of(i))
 
         # uniform colouring
-        base_color = Color(self.next)
-        self.colors[self.next] = base_color
-        self.queue.append(base_color)
-        for graph in self.graphs:
-            for vertex in graph.vertices:
-                self.labels[vertex] = self.next
-                self.neighbours[vertex] = {}
-                self.neighbours[vertex][self.next] = vertex.degree
-                self.colors[self.next].states.append(vertex)
-        self.next += 1
+        self.partition = self.__partition(vertices)
+        self.queue.clear()
+        if len(self.partition) > 0:
+            self.__enqueue(0)
 
+        if values is not None:
+            self.split_by(values)
         return self
 
-    def refine(self):
+    def split_by(self, values):
+        """
+        Splits every colour by the given values (e.g. vertex invariants, indexed by vertex id)
+        in the order of the values, so that it does not depend on the order of the vertices,
+        and queues the new colours like a split by refinement.
+        """
+        partition = self.partition
+        for cell in list(partition.cells()):
+            end = partition.cell_end[cell]
+            if end - cell == 1:
+                continue
+            vertices = sorted(partition.elements[cell:end], key=values.__getitem__)
+            starts = [i for i in range(cell + 1, end) if values[vertices[i - cell]] != values[vertices[i - cell - 1]]]
+            if len(starts) == 0:
+                continue
+            partition.elements[cell:end] = vertices
+            for i, v in enumerate(vertices, cell):
+                partition.position[v] = i
+            partition.split(cell, starts)
+            self.__enqueue_parts(cell, starts)
+
+    def refine(self, pair=False):
         while len(self.queue) != 0:
-            self.refine_color()
+            if not self.refine_color(pair):
+                break
         return self
 
-    def refine_color(self):
-        color = self.queue.popleft()
-        color.inQueue = False
-        neighbours = {}
-
-        for i in range(len(color)):
-            for n in color.states[i].neighbours:
-                tuple = (self.labels[n], self.neighbours[n][color.label])
-                if tuple not in neighbours:
-                    neighbours[tuple] = set(())
-                neighbours[tuple].add(n)
-
-        for n in neighbours:
-            color = n[0]
-
-            if len(neighbours[n]) < len(self.colors[color]):
-                new_color = Color(self.next)
-                self.colors[new_color.label] = new_color
-                self.next += 1
-
-                j = len(self.colors[color]) - len(neighbours[n])
-                if j > len(neighbours[n]) or self.colors[color].inQueue:
-                    self.queue.append(new_color)
-                    new_color.inQueue = True
-                else:
-                    self.queue.append(self.colors[color])
-                    self.colors[color].inQueue = True
-
-                for nn in neighbours[n]:
-                    for neighbour in nn.neighbours:
-                        if new_color.label not in self.neighbours[neighbour].keys():
-                            self.neighbours[neighbour][new_color.label] = 0
-                        self.neighbours[neighbour][new_color.label] += 1
-                    self.colors[color].states.remove(nn)
-                    self.colors[new_color.label].states.append(nn)
-                    self.labels[nn] = new_color.label 
+    def refine_color(self, pair=False) -> bool:
+        """
+        Splits every colour by the number of neighbours in the next colour of the queue.
+        :return: False if the pair turned out to be unbalanced (with `pair`), True otherwise
+        """
+        partition = self.partition
+        cell = self.queue.popleft()
+        partition.in_queue[cell] = False
+        offsets = self.compact.offsets
+        targets = self.compact.targets
+        cell_of = partition.cell_of
+
+        # count neighbours in the splitter
+        count = {}
+        for v in partition.vertices_of(cell):
+            for n in targets[offsets[v]:offsets[v + 1]]:
+                count[n] = count.get(n, 0) + 1
+
+        touched = {}
+        for n in count:
+            c = cell_of[n]
+            if c in touched:
+                touched[c].append(n)
+            else:
+                touched[c] = [n]
+
+        signature = partition.signature
+        for c in sorted(touched):
+            self.__split(c, touched[c], count)
+            if pair and signature[0] != signature[1]:
+                return False
+        return True
+
+    def __split(self, cell, touched, count):
+        """
+        Splits a cell into the untouched vertices followed by the touched ones
+        ordered by their count, and queues all but the largest new cell.
+        """
+        partition = self.partition
+        end = partition.cell_end[cell]
+        if len(touched) == end - cell:
+            first = count[touched[0]]
+            if all(count[v] == first for v in touched):
+                return
+
+        # sort the touched vertices by count at the tail of the cell
+        boundary = partition.move_to_tail(cell, touched)
+        touched.sort(key=count.__getitem__)
+        partition.elements[boundary:end] = touched
+        position = partition.position
+        for i, v in enumerate(touched, boundary):
+            position[v] = i
+
+        starts = [] if boundary == cell else [boundary]
+        for i in range(1, len(touched)):
+            if count[touched[i]] != count[touched[i - 1]]:
+                starts.append(boundary + i)
+        partition.split(cell, starts)
+
+        self.__enqueue_parts(cell, starts)
+
+    def __enqueue_parts(self, cell, starts):
+        """
+        Queues the new cells of a split (all but the largest if the cell was not queued).
+        """
+        partition = self.partition
+        if partition.in_queue[cell]:
+            for start in starts:
+                self.__enqueue(start)
+        else:
+            cells = [cell] + starts
+            largest = max(cells, key=lambda c: partition.cell_end[c] - c)
+            for start in cells:
+                if start != largest:
+                    self.__enqueue(start)
+
+    def __enqueue(self, cell):
+        self.partition.in_queue[cell] = True
+        self.queue.append(cell)
+
+    def individualise(self, vertices):
+        """
+        Moves the vertices (of one colour) to a new colour at the end of their colour.
+        """
+        partition = self.partition
+        cell = partition.cell_of[vertices[0]]
+        if len(vertices) == partition.cell_end[cell] - cell:
+            return
+        start = partition.move_to_tail(cell, vertices)
+        partition.split(cell, [start])
+        self.__enqueue(start)
+
+    def balanced(self) -> bool:
+        signature = self.partition.signature
+        return signature is None or signature[0] == signature[1]
+
+    def mark(self) -> int:
+        return len(self.partition.trail)
+
+    def undo(self, mark: int):
+        for cell in self.queue:
+            self.partition.in_queue[cell] = False
+        self.queue.clear()
+        self.partition.undo(mark)
 
     def group(self):
+        """
+        Returns the groups of graphs with the same colour histogram (of at least two graphs).
+        Graphs are bucketed by signature, and only the histograms of graphs that share
+        a signature are counted, to confirm it.
+        """
+        signature = self.partition.signature
+        if signature is None:
+            return []
+        buckets = {}
+        for i in sorted(self.active):
+            buckets.setdefault(signature[i], []).append(i)
+
         groups = []
-        for graph, colors in self.count().items():
-            # check if such group already exists
-            new_group = True
-            for group in groups:
-                if group.colors == colors:
-                    group.graphs.append(graph)
-                    new_group = False
-                    break
-            # if not, create a new group
-            if new_group:
-                discrete = all(count == 1 for count in colors.values())
-                groups.append(ColorGroup([graph], colors, discrete))
-
-        # filter out groups with only one graph
-        return [group for group in groups if len(group.graphs) > 1]
-
-    def count(self) -> list[tuple[int, dict[int: int]]]:
+        for bucket in buckets.values():
+            if len(bucket) == 1:
+                continue
+            histograms = {}
+            for i in bucket:
+                colors = self.__histogram(i)
+                histograms.setdefault(frozenset(colors.items()), (colors, []))[1].append(self.graphs[i])
+            for colors, graphs in histograms.values():
+                if len(graphs) > 1:
+                    discrete = all(count == 1 for count in colors.values())
+                    groups.append(ColorGroup(graphs, colors, discrete))
+        return groups
+
+    def count(self) -> dict[Graph, dict[int, int]]:
         count = {}
-        for color in self.colors.values():
-            for vertex in color.states:
-                graph = vertex.graph
-                if graph not in count:
-                    count[graph] = {}
-                old_count = count[graph].get(color.label, 0)
-                count[graph][color.label] = old_count + 1
+        graph_of = self.compact.graph_of
+        for i in sorted(self.active):
+            count[self.graphs[i]] = {}
+        for cell in self.partition.cells():
+            for vertex in self.partition.vertices_of(cell):
+                graph_count = count[self.graphs[graph_of[vertex]]]
+                graph_count[cell] = graph_count.get(cell, 0) + 1
         return count
 
+    def __histogram(self, i) -> dict[int, int]:
+        histogram = {}
+        cell_of = self.partition.cell_of
+        for vertex in self.compact.vertices_of(i):
+            cell = cell_of[vertex]
+            histogram[cell] = histogram.get(cell, 0) + 1
+        return histogram
+
+    def __partition(self, vertices):
+        """
+        Returns a partition of the vertices into one cell, keeping the signatures of the
+        colour histograms if there is more than one graph.
+        """
+        if len(self.active) > 1:
+            return Partition(vertices, self.compact.n, self.compact.graph_of, len(self.compact.starts) - 1)
+        return Partition(vertices, self.compact.n)
+
     def vertices_of(self, graph, color):
-        return [v for v in self.colors[color].states if v.graph is graph]
+        i = self.index[graph]
+        graph_of = self.compact.graph_of
+        return [v for v in self.partition.vertices_of(color) if graph_of[v] == i]
 
     def first_vertex_of(self, graph, color):
-        for v in self.colors[color].states:
-            if v.graph is graph:
+        i = self.index[graph]
+        graph_of = self.compact.graph_of
+        for v in self.partition.vertices_of(color):
+            if graph_of[v] == i:
                 return v
 
-    def copy(self, graphs: set[Graph]):
-        copy = GraphFastRef(graphs)
-        copy.colors = {c.label: c.copy(graphs) for c in self.colors.values()}
-        copy.labels = {v: c for v, c in self.labels.items() if v.graph in graphs}
-        copy.neighbours = {v: n.copy() for v, n in self.neighbours.items()}
-        copy.next = self.next
-        return copy
-
-    def assign(self, vertex, color):
-        if color not in self.colors:
-            self.colors[color] = Color(color)
-
-        for neighbour in vertex.neighbours:
-            if color not in self.neighbours[neighbour].keys():
-                self.neighbours[neighbour][color] = 0
-            self.neighbours[neighbour][color] += 1
+    def copy(self, graphs: list[Graph]):
+        """
+        Returns a copy of the colouring restricted to the given graphs.
+        """
+        active = set(self.index[graph] for graph in graphs)
+        graph_of = self.compact.graph_of
+        old = self.partition
+        copy = GraphFastRef(self.graphs, self.compact)
+        copy.active = active
+        copy.partition = copy.__partition([v for v in old.elements if graph_of[v] in active])
 
-        self.colors[self.labels[vertex]].states.remove(vertex)
-        self.colors[color].states.append(vertex)
-        self.labels[vertex] = color
\ No newline at end of file
+        # cut the copied elements into the same colours
+        partition = copy.partition
+        starts = []
+        for i in range(1, len(partition)):
+            if old.cell_of[partition.elements[i]] != old.cell_of[partition.elements[i - 1]]:
+                starts.append(i)
+        if len(partition) > 0:
+            partition.split(0, starts)
+        for cell in partition.cells():
+            if old.in_queue[old.cell_of[partition.elements[cell]]]:
+                copy.__enqueue(cell)
+        return copy
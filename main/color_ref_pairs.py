@@ -0,0 +1,81 @@
+from compact_graph import CompactGraph
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# odd constants of the 64-bit mixing function (splitmix64)
+MIX = 0xbf58476d1ce4e5b9, 0x94d049bb133111eb
+
+
+def mix(values, seed: int):
+    """
+    Returns a 64-bit hash of every value of an array (of uint64), different for every seed.
+    """
+    with numpy.errstate(over='ignore'):
+        z = values + numpy.uint64(seed * 0x9e3779b97f4a7c15 % 2 ** 64)
+        z = (z ^ (z >> numpy.uint64(30))) * numpy.uint64(MIX[0])
+        z = (z ^ (z >> numpy.uint64(27))) * numpy.uint64(MIX[1])
+        return z ^ (z >> numpy.uint64(31))
+
+
+class GraphPairRef(object):
+    """
+    Usage of GraphPairRef class (2-dimensional Weisfeiler-Leman refinement, needs numpy):
+    pairRef = GraphPairRef(compact)
+    GraphPairRef.available()        returns whether numpy is there
+
+    pairRef.refine()                refines the colours of all pairs of vertices until stable
+    pairRef.refine(values)          starts from the given values of the vertices as well (e.g. their colours)
+    pairRef.colours                 colour of every pair (u, v) as an n x n array (after refine)
+    pairRef.vertex_colours()        returns the colour of every vertex: the colour of (v, v)
+    pairRef.histogram()             returns the sorted colours of all pairs (as bytes)
+
+    A pair starts with its value on the diagonal, or whether it is an edge otherwise. In every
+    round, the colour of (u, v) is combined with a hash of the multiset of colour pairs
+    ((u, w), (w, v)) over all vertices w. This hash is the sum of the products of
+    a hash of the first colour and another hash of the second one, that is one product of
+    matrices (wrapping around at 2^64, so the order of the sums does not matter).
+
+    Colours are 64-bit hashes instead of numbers of classes, so they mean the same in
+    different graphs (given the same values), and refinement runs until the number of
+    colours stops growing, which takes O(n^3) per round.
+    """
+
+    def __init__(self, compact: CompactGraph):
+        self.n = compact.n
+        rows = numpy.repeat(numpy.arange(self.n), numpy.asarray(compact.degrees))
+        self.adjacency = numpy.zeros((self.n, self.n), dtype=bool)
+        self.adjacency[rows, numpy.asarray(compact.targets, dtype=numpy.int64)] = True
+        self.colours = None
+
+    @staticmethod
+    def available() -> bool:
+        return numpy is not None
+
+    def refine(self, values=None):
+        n = self.n
+        colours = numpy.where(self.adjacency, numpy.uint64(1), numpy.uint64(2))
+        diagonal = numpy.zeros(n, dtype=numpy.uint64) if values is None \
+            else numpy.asarray(values, dtype=numpy.uint64)
+        colours[numpy.arange(n), numpy.arange(n)] = mix(diagonal, 0) ^ colours.diagonal()
+
+        count = len(numpy.unique(colours))
+        for _ in range(n * n):
+            with numpy.errstate(over='ignore'):
+                walks = mix(colours, 1) @ mix(colours, 2)
+            colours = mix(colours ^ mix(walks, 3), 4)
+            refined = len(numpy.unique(colours))
+            if refined == count:
+                break
+            count = refined
+        self.colours = colours
+        return self
+
+    def vertex_colours(self) -> list[int]:
+        return self.colours.diagonal().tolist()
+
+    def histogram(self) -> bytes:
+        return numpy.sort(self.colours, axis=None).tobytes()
@@ -0,0 +1,213 @@
+from array import array
+from graph import Graph
+from itertools import compress
+
+
+class CompactGraph(object):
+    """
+    Array-backed (CSR) representation of one or more undirected graphs,
+    where the vertices of all graphs are numbered 0..n-1 one graph after another.
+    compact = CompactGraph.from_graphs([G1, G2, ...])
+    compact = CompactGraph.union([C1, C2, ...])
+    compact = CompactGraph.from_edges(n, [U1, V1, U2, V2, ...])
+
+    compact.n                       number of vertices
+    compact.offsets                 neighbours of v are targets[offsets[v]:offsets[v + 1]]
+    compact.targets                 concatenated neighbour lists
+    compact.degrees                 number of neighbours of each vertex (built on first use)
+    compact.graph_of                index of the graph that each vertex belongs to (built on first use)
+    compact.starts                  first vertex id of each graph (with n at the end)
+    compact.vertices                the original `Vertex` object of each vertex id
+
+    compact.neighbours(v)           returns the neighbours of a vertex
+    compact.vertices_of(i)          returns the range of vertex ids of the i-th graph
+    compact.graph(i)                returns the i-th graph as a CompactGraph of its own
+    compact.complement()            returns the complement as a CompactGraph
+    compact.is_dense(i)             returns whether the i-th graph has more than half of all possible edges
+    compact.components()            returns the connected components (as lists of vertex ids)
+    compact.subgraph(vertices)      returns the subgraph of a component as a CompactGraph
+    compact.twins()                 returns the classes of vertices with the same neighbours
+    """
+
+    def __init__(self, offsets, targets, starts=None, vertices=None):
+        self.n = len(offsets) - 1
+        self.offsets = offsets
+        self.targets = targets
+        self.starts = starts if starts is not None else array('i', [0, self.n])
+        self.vertices = vertices
+        self._degrees = None
+        self._graph_of = None
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def degrees(self) -> array:
+        if self._degrees is None:
+            offsets = self.offsets
+            self._degrees = array('i', [offsets[v + 1] - offsets[v] for v in range(self.n)])
+        return self._degrees
+
+    @property
+    def graph_of(self) -> array:
+        if self._graph_of is None:
+            self._graph_of = array('i')
+            for i in range(len(self.starts) - 1):
+                self._graph_of.extend([i] * (self.starts[i + 1] - self.starts[i]))
+        return self._graph_of
+
+    @staticmethod
+    def from_graphs(graphs: list[Graph]) -> "CompactGraph":
+        """
+        Builds a disjoint union of the given graphs (once) from their incidence maps.
+        Multi-edges are merged, so every neighbour is listed exactly once.
+        """
+        offsets = array('i', [0])
+        targets = array('i')
+        starts = array('i', [0])
+        vertices = []
+        for graph in graphs:
+            start = len(vertices)
+            index = {v: start + i for i, v in enumerate(graph.vertices)}
+            for vertex in graph.vertices:
+                targets.extend([index[n] for n in vertex._incidence])
+                offsets.append(len(targets))
+            vertices += graph.vertices
+            starts.append(len(vertices))
+        return CompactGraph(offsets, targets, starts, vertices)
+
+    @staticmethod
+    def from_edges(n: int, ends) -> "CompactGraph":
+        """
+        Builds a graph on the vertices 0..n-1 from the ends of its edges (two per edge).
+        Multi-edges are merged, and every neighbour list is sorted.
+        """
+        neighbours = [set() for _ in range(n)]
+        for i in range(0, len(ends), 2):
+            u, v = ends[i], ends[i + 1]
+            neighbours[u].add(v)
+            neighbours[v].add(u)
+        offsets = array('i', [0])
+        targets = array('i')
+        for v in range(n):
+            targets.extend(sorted(neighbours[v]))
+            offsets.append(len(targets))
+        return CompactGraph(offsets, targets)
+
+    @staticmethod
+    def union(compacts: list["CompactGraph"]) -> "CompactGraph":
+        """
+        Builds a disjoint union of compact graphs, one graph for each of them.
+        """
+        offsets = array('i', [0])
+        targets = array('i')
+        starts = array('i', [0])
+        for compact in compacts:
+            start, first = starts[-1], len(targets)
+            offsets.extend(first + offset for offset in compact.offsets[1:])
+            targets.extend(start + v for v in compact.targets)
+            starts.append(start + compact.n)
+        return CompactGraph(offsets, targets, starts)
+
+    def neighbours(self, v: int):
+        """
+        Returns the neighbours of a vertex as an array slice.
+        """
+        return self.targets[self.offsets[v]:self.offsets[v + 1]]
+
+    def vertices_of(self, i: int) -> range:
+        """
+        Returns the range of vertex ids of the i-th graph.
+        """
+        return range(self.starts[i], self.starts[i + 1])
+
+    def graph(self, i: int) -> "CompactGraph":
+        """
+        Returns the i-th graph with its vertex ids starting from 0.
+        """
+        start, end = self.starts[i], self.starts[i + 1]
+        first = self.offsets[start]
+        offsets = array('i', [offset - first for offset in self.offsets[start:end + 1]])
+        targets = array('i', [v - start for v in self.targets[first:self.offsets[end]]])
+        vertices = None if self.vertices is None else self.vertices[start:end]
+        return CompactGraph(offsets, targets, None, vertices)
+
+    def is_adjacent(self, u: int, v: int) -> bool:
+        """
+        Returns True iff `u` and `v` are adjacent.
+        """
+        if self.degrees[u] > self.degrees[v]:
+            u, v = v, u
+        return v in self.neighbours(u)
+
+    def twins(self) -> list[list[int]]:
+        """
+        Returns the classes (of at least two vertices) of false twins, which have the same
+        neighbours, and of true twins, which are adjacent and have the same other neighbours.
+        Twins have a self-loop either both or neither. Neighbourhoods are hashed as sets,
+        so this takes O(n + m) expected time.
+        """
+        classes = {}
+        for v in range(self.n):
+            neighbours = frozenset(self.neighbours(v))
+            loop = v in neighbours
+            classes.setdefault((False, loop, neighbours - {v}), []).append(v)
+            classes.setdefault((True, loop, neighbours | {v}), []).append(v)
+        return [twins for twins in classes.values() if len(twins) > 1]
+
+    def components(self) -> list[list[int]]:
+        """
+        Returns the vertex ids of every connected component, in breadth-first order.
+        """
+        visited = [False] * self.n
+        components = []
+        for root in range(self.n):
+            if visited[root]:
+                continue
+            visited[root] = True
+            component = [root]
+            for v in component:
+                for u in self.neighbours(v):
+                    if not visited[u]:
+                        visited[u] = True
+                        component.append(u)
+            components.append(component)
+        return components
+
+    def subgraph(self, vertices: list[int]) -> "CompactGraph":
+        """
+        Returns the subgraph on the given vertices, numbered 0..k-1 in the given order.
+        All neighbours of the vertices have to be among them (e.g. a connected component).
+        """
+        index = {v: i for i, v in enumerate(vertices)}
+        offsets = array('i', [0])
+        targets = array('i')
+        for v in vertices:
+            targets.extend(index[u] for u in self.neighbours(v))
+            offsets.append(len(targets))
+        return CompactGraph(offsets, targets)
+
+    def is_dense(self, i: int = 0) -> bool:
+        """
+        Returns True iff the i-th graph has more edges than its complement.
+        """
+        start, end = self.starts[i], self.starts[i + 1]
+        return self.offsets[end] - self.offsets[start] > (end - start) * (end - start - 1) // 2
+
+    def complement(self) -> "CompactGraph":
+        """
+        Returns the complement (of every graph). Each neighbour list is built at once from
+        a mask of the vertices of the graph, and self-loops are kept as they are.
+        """
+        offsets = array('i', [0])
+        targets = array('i')
+        for i in range(len(self.starts) - 1):
+            start, end = self.starts[i], self.starts[i + 1]
+            for v in range(start, end):
+                mask = bytearray(b'\x01') * (end - start)
+                for u in self.neighbours(v):
+                    mask[u - start] = 0
+                mask[v - start] = 1 - mask[v - start]
+                targets.extend(compress(range(start, end), mask))
+                offsets.append(len(targets))
+        return CompactGraph(offsets, targets, self.starts, self.vertices)
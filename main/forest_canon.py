@@ -0,0 +1,188 @@
+from compact_graph import CompactGraph
+from math import factorial
+
+
+def is_forest(compact: CompactGraph) -> bool:
+    """
+    Returns True iff the graph has no cycles (a breadth-first search meets no vertex twice).
+    """
+    parent = [-1] * compact.n
+    visited = [False] * compact.n
+    for root in range(compact.n):
+        if visited[root]:
+            continue
+        visited[root] = True
+        queue = [root]
+        for v in queue:
+            for u in compact.neighbours(v):
+                if u == parent[v]:
+                    continue
+                if visited[u]:
+                    return False
+                visited[u] = True
+                parent[u] = v
+                queue.append(u)
+    return True
+
+
+class ForestCanon(object):
+    """
+    Usage of ForestCanon class (for graphs without cycles, see `is_forest`):
+    canon = ForestCanon(compact, codes)
+
+    canon.certificate()             returns a hashable certificate (equal iff forests are isomorphic)
+    canon.count()                   returns the number of automorphisms
+    canon.generators()              returns generators of the automorphism group (as lists of vertex ids)
+
+    Every tree is rooted at its centre (or the edge between its two centres) and encoded
+    bottom-up (AHU): a vertex gets the integer code of the sorted codes of its children,
+    from the table `codes`, so forests compared with each other have to share it.
+    Identical subtrees below a vertex can be permuted freely, so the number of automorphisms
+    is the product of the factorials of their multiplicities (and likewise for identical trees
+    of the forest, or the two halves of a tree with two centres). Swaps of consecutive
+    identical subtrees (trees, halves) generate all automorphisms.
+    """
+
+    def __init__(self, compact: CompactGraph, codes: dict = None):
+        self.compact = compact
+        self.codes = codes if codes is not None else {}
+        self.trees = None
+        self.code = {}
+        self.children = {}
+        self.roots = []
+
+    def certificate(self):
+        if self.trees is None:
+            self.__encode()
+        return 'forest', tuple(sorted(self.trees))
+
+    def count(self) -> int:
+        if self.trees is None:
+            self.__encode()
+        return self.__count_identical(self.trees) * self.tree_count
+
+    def generators(self) -> list[list[int]]:
+        if self.trees is None:
+            self.__encode()
+        pairs = []
+        for children in self.children.values():
+            pairs += [([a], [b]) for a, b in self.__consecutive(children, self.code)]
+        pairs += [(self.roots[a], self.roots[b]) for a, b in self.__consecutive(range(len(self.trees)), self.trees)]
+        for roots in self.roots:
+            if len(roots) == 2 and self.code[roots[0]] == self.code[roots[1]]:
+                pairs.append(([roots[0]], [roots[1]]))
+        return [self.__swap(a, b) for a, b in pairs]
+
+    @staticmethod
+    def __consecutive(items, codes) -> list[tuple]:
+        """
+        Returns the pairs of consecutive items with the same code.
+        """
+        same = {}
+        for item in items:
+            same.setdefault(codes[item], []).append(item)
+        return [pair for items in same.values() for pair in zip(items, items[1:])]
+
+    def __swap(self, a, b) -> list[int]:
+        """
+        Returns the automorphism that swaps the identical subtrees below the roots `a` and `b`
+        (matching children with the same codes) and fixes all other vertices.
+        """
+        perm = list(range(self.compact.n))
+        key = self.code.__getitem__
+        queue = list(zip(sorted(a, key=key), sorted(b, key=key)))
+        for x, y in queue:
+            perm[x], perm[y] = y, x
+            queue += zip(sorted(self.children[x], key=key), sorted(self.children[y], key=key))
+        return perm
+
+    def __encode(self):
+        """
+        Encodes every tree of the forest and counts its automorphisms.
+        """
+        self.trees = []
+        self.tree_count = 1
+        visited = [False] * self.compact.n
+        for root in range(self.compact.n):
+            if visited[root]:
+                continue
+            tree = self.__tree(root, visited)
+            centres = self.__centres(tree)
+            self.roots.append(centres)
+            code, count = self.__encode_rooted(centres)
+            if len(centres) == 2:
+                halves = tuple(sorted(code))
+                code = self.codes.setdefault(('edge',) + halves, len(self.codes))
+                count *= 2 if halves[0] == halves[1] else 1
+            else:
+                code = code[0]
+            self.trees.append(code)
+            self.tree_count *= count
+
+    def __tree(self, root, visited) -> list[int]:
+        visited[root] = True
+        tree = [root]
+        for v in tree:
+            for u in self.compact.neighbours(v):
+                if not visited[u]:
+                    visited[u] = True
+                    tree.append(u)
+        return tree
+
+    def __centres(self, tree) -> list[int]:
+        """
+        Removes the leaves of the tree layer by layer until one or two vertices are left.
+        """
+        degrees = self.compact.degrees
+        degree = {v: degrees[v] for v in tree}
+        removed = set()
+        leaves = [v for v in tree if degree[v] <= 1]
+        while len(tree) - len(removed) > 2:
+            next_leaves = []
+            for leaf in leaves:
+                removed.add(leaf)
+                for u in self.compact.neighbours(leaf):
+                    if u not in removed:
+                        degree[u] -= 1
+                        if degree[u] == 1:
+                            next_leaves.append(u)
+            leaves = next_leaves
+        return [v for v in tree if v not in removed]
+
+    def __encode_rooted(self, roots):
+        """
+        Encodes the subtrees hanging from the roots (the roots being each other's parent).
+        :return: the codes of the roots and the number of automorphisms that fix them
+        """
+        parent = {root: other for root in roots for other in roots if other != root}
+        order = list(roots)
+        for v in order:
+            for u in self.compact.neighbours(v):
+                if u != parent.get(v):
+                    parent[u] = v
+                    order.append(u)
+
+        # identical subtrees of a vertex can be permuted, independently for every vertex
+        children = {}
+        code, count = {}, 1
+        for v in reversed(order):
+            self.children[v] = children.pop(v, [])
+            child_codes = sorted(code[u] for u in self.children[v])
+            code[v] = self.codes.setdefault(tuple(child_codes), len(self.codes))
+            count *= self.__count_identical(child_codes)
+            if v not in roots:
+                children.setdefault(parent[v], []).append(v)
+        self.code.update(code)
+        return [code[root] for root in roots], count
+
+    def __count_identical(self, codes) -> int:
+        """
+        Returns the number of permutations of the codes that leave them unchanged.
+        """
+        count = 1
+        multiplicities = {}
+        for code in codes:
+            multiplicities[code] = multiplicities.get(code, 0) + 1
+        for multiplicity in multiplicities.values():
+            count *= factorial(multiplicity)
+        return count
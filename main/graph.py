@@ -4,7 +4,7 @@ This is a module for working with directed and undirected multigraphs.
 # version: 29-01-2015, Paul Bonsma
 # version: 01-02-2017, Pieter Bos, Tariq Bontekoe
 
-from typing import List, Union, Set
+from typing import Iterable, List, Union, Set
 
 
 class GraphError(Exception):
@@ -242,9 +242,7 @@ class Graph(object):
         union = Graph(directed, 0, simple)
         v_map = union.copy_vertices(self._v + other._v)
 
-        for e in self._e + other._e:
-            e_copy = Edge(v_map[e.tail], v_map[e.head], e.weight)
-            union.add_edge(e_copy)
+        union._add_edges(Edge(v_map[e.tail], v_map[e.head], e.weight) for e in self._e + other._e)
 
         return union
 
@@ -348,6 +346,30 @@ class Graph(object):
         edge.head._add_incidence(edge)
         edge.tail._add_incidence(edge)
 
+    def _add_edges(self, edges: Iterable["Edge"]):
+        """
+        For internal use only; adds edges between vertices of the graph without the checks of
+        `add_edge` (which looks up both vertices in the vertex list, taking O(n) per edge).
+        If a subclass overrides `add_edge`, it is called for every edge instead.
+        :param edges: The edges to be added
+        """
+        if type(self).add_edge in (Graph.add_edge, UnsafeGraph.add_edge):
+            self._append_edges(edges)
+        else:
+            for edge in edges:
+                self.add_edge(edge)
+
+    def _append_edges(self, edges: Iterable["Edge"]):
+        """
+        For internal use only; appends edges and their incidences without any checks
+        :param edges: The edges to be added
+        """
+        for edge in edges:
+            self._e.append(edge)
+            head, tail = edge._head, edge._tail
+            head._incidence.setdefault(tail, set()).add(edge)
+            tail._incidence.setdefault(head, set()).add(edge)
+
     def find_edge(self, u: "Vertex", v: "Vertex") -> Set["Edge"]:
         """
         Tries to find edges between two vertices.
@@ -384,24 +406,22 @@ class Graph(object):
         graph = Graph(self._directed, 0, self._simple)
         v_map = graph.copy_vertices(self._v)
 
-        for e in self._e:
-            e_copy = Edge(v_map[e.tail], v_map[e.head])
-            graph.add_edge(e_copy)
+        graph._add_edges(Edge(v_map[e.tail], v_map[e.head]) for e in self._e)
 
         return graph
 
     def complement(self) -> "Graph":
+        """
+        Returns the complement. The new edges join distinct non-adjacent vertices, so they
+        are added without the checks of `add_edge`.
+        """
         graph = Graph(self._directed, 0, self._simple)
         v_map = graph.copy_vertices(self._v)
-        v_len = len(self._v)
 
-        for i in range(v_len):
-            for j in range(0 if self._directed else i + 1, v_len):
-                v1 = self._v[i]
-                v2 = self._v[j]
-                if v1 != v2 and not v1.is_adjacent(v2):
-                    edge = Edge(v_map[v1], v_map[v2])
-                    graph.add_edge(edge)
+        for i, v1 in enumerate(self._v):
+            adjacent = v1._incidence
+            graph._add_edges(Edge(v_map[v1], v_map[v2]) for v2 in self._v[0 if self._directed else i + 1:]
+                             if v1 != v2 and v2 not in adjacent)
 
         return graph
 
@@ -464,10 +484,7 @@ class UnsafeGraph(Graph):
         self._v.append(vertex)
 
     def add_edge(self, edge: "Edge"):
-        self._e.append(edge)
-
-        edge.head._add_incidence(edge)
-        edge.tail._add_incidence(edge)
+        self._append_edges((edge,))
 
     def find_edge(self, u: "Vertex", v: "Vertex") -> Set["Edge"]:
         left = u._incidence.get(v, None)
@@ -0,0 +1,292 @@
+from array import array
+from collections import deque
+from color_ref_fast import GraphFastRef
+from color_ref_pairs import GraphPairRef
+from compact_graph import CompactGraph
+from graph_io import SharedGraphs
+from invariants import vertex_invariants
+from orbits import Orbits
+from perm_group import PermGroup
+
+
+# the search that a worker process set up last: (name of its graph, GraphAut, refined colouring)
+worker = None
+
+
+class GraphAut(object):
+    """
+    Usage of GraphAut class:
+    aut = GraphAut(compact)
+    aut = GraphAut(compact, twins, invariants=True)
+                                    starts from the colouring by vertex invariants (see invariants.py)
+    aut = GraphAut(compact, twins, depths=(0, 1))
+                                    refines pairs of vertices at these depths (0 is the root) as well
+                                    (see GraphPairRef, needs numpy)
+    aut = GraphAut(compact, twins, automorphisms=[P1, P2, ...])
+                                    starts from automorphisms known before (e.g. GraphCanon.automorphisms)
+
+    aut.group()                     returns the automorphism group (PermGroup) of the graph
+    aut.group().order()             returns the number of automorphisms
+    aut.group().orbits()            returns the orbits of the vertices (by vertex index)
+    aut.group(pool, width)          searches up to `width` branches at once in a process pool
+                                    (from SharedGraphs.pool)
+
+    The search refines the graph together with its copy and individualises the first vertex x
+    of the smallest colour in the graph together with a vertex y of the copy. Along the "trivial"
+    path (where y is the copy of x) the vertices x form a base. For every other y of the
+    colour, one isomorphism is searched that maps x to y; it is an automorphism which
+    fixes the base points so far, so these generate the whole group (and are a strong
+    generating set), and the order follows from Schreier-Sims instead of enumerating
+    every automorphism.
+
+    A colouring is taken to be balanced when the signatures of the colour histograms of
+    both graphs agree (see Partition), which is checked for the colours of a leaf. Refinement
+    below an individualisation stops at the first split that unbalances the pair.
+
+    Vertices y in the same orbit as an explored one (under the automorphisms found so
+    far that fix the images chosen on the path) give the same result and are skipped.
+    Swapping two twins (given as classes of vertex indices, see CompactGraph.twins) is an
+    automorphism as well, so these swaps are known from the start, together with the
+    automorphisms given (the canonical labelling finds most of them while pruning its own
+    search). Known automorphisms only let the search skip branches: the generators found
+    on the way still make up a strong generating set.
+
+    In the parallel search, the trivial path is followed first, and the other images of
+    every base point (deepest first) are searched by the workers of the pool. A branch is
+    sent as its individualisation sequence, which the worker replays on its own refined
+    copy of the graph. Branches are handed out in order to whichever worker is free, and
+    their results are taken in the same order, so the generators found (and the branches
+    skipped by orbit pruning) do not depend on timing.
+    """
+
+    def __init__(self, compact: CompactGraph, twins=None, invariants=False, depths=(), automorphisms=()):
+        self.n = compact.n
+        self.twins = twins
+        self.known = [list(perm) for perm in automorphisms]
+        self.invariants = invariants
+        self.depths = depths
+        self.pairs = GraphPairRef(compact) if len(depths) > 0 else None
+        self.pair = [compact, CompactGraph(compact.offsets, compact.targets)]
+        self.compact = CompactGraph.union(self.pair)
+
+    def group(self, pool=None, width=1) -> PermGroup:
+        colors = self.__reset()
+        self.generators = self.__swaps() + self.known
+        self.base = []
+        if pool is None:
+            self.__search(colors, [], True)
+        else:
+            self.__search_parallel(colors, pool, width)
+        return PermGroup(self.n, self.generators, self.base, strong=True)
+
+    @staticmethod
+    def search_branch(args):
+        """
+        Searches one isomorphism below an individualisation sequence of pairs (x, y), given
+        with the name of the shared graph, the options of the search (whether to start from
+        vertex invariants and the depths at which to refine pairs) and the generators that
+        fix the sequence.
+        Runs in a worker process, which keeps the refined pair for the next branches.
+        :return: the automorphism found, or None
+        """
+        global worker
+        name, (invariants, depths), sequence, generators = args
+        if worker is None or worker[0] != name:
+            graphs = SharedGraphs(name)
+            shared = graphs[0]
+            compact = CompactGraph(array('i', shared.offsets), array('i', shared.targets))
+            del shared
+            graphs.close()
+            aut = GraphAut(compact, invariants=invariants, depths=depths)
+            worker = name, aut, aut.__reset()
+        _, aut, refined = worker
+
+        # every branch starts from a copy of the refined pair: undoing a search restores the
+        # colours but not the order of the vertices within them, which would make the result
+        # depend on the branches that this worker happened to search before
+        colors = refined.copy(aut.pair)
+        for depth, pair in enumerate(sequence, 1):
+            colors.individualise(list(pair))
+            aut.__refine(colors, depth)
+        aut.generators = generators
+        found = aut.__search(colors, [y - aut.n for _, y in sequence], False)
+        return aut.generators[-1] if found else None
+
+    def __search(self, colors, path, trivial) -> bool:
+        """
+        Searches isomorphisms that agree with the colouring of the pair: all of them
+        on the trivial path, one otherwise.
+        :return: whether an isomorphism was found
+        """
+        partition = colors.partition
+
+        # if coloring is unbalanced, there are no isomorphisms
+        if not colors.balanced():
+            return False
+
+        # if coloring defines a bijection, it is an isomorphism
+        if partition.size == self.n:
+            perm = None if trivial else self.__mapping(colors)
+            if perm is not None:
+                self.generators.append(perm)
+            return trivial or perm is not None
+
+        # get x and y vertices (the copy of x first)
+        branch = self.__branch(colors)
+        if branch is None:
+            return False
+        x, y_all = branch
+        if trivial:
+            self.base.append(x)
+            y_all.sort(key=lambda y: y != x + self.n)
+
+        # orbits of the automorphisms found so far that fix the path
+        orbits, seen = None, 0
+        explored = []
+        for y in y_all:
+            v = y - self.n
+            if len(explored) > 0:
+                while seen < len(self.generators):
+                    perm = self.generators[seen]
+                    seen += 1
+                    if all(perm[u] == u for u in path):
+                        if orbits is None:
+                            orbits = Orbits(self.n)
+                        orbits.add(perm)
+                if orbits is not None and any(orbits.same(u, v) for u in explored):
+                    continue
+            explored.append(v)
+
+            mark = colors.mark()
+            colors.individualise([x, y])
+            self.__refine(colors, len(path) + 1)
+            found = self.__search(colors, path + [v], trivial and y == x + self.n)
+            colors.undo(mark)
+            if found and not trivial:
+                return True
+
+        return trivial
+
+    def __search_parallel(self, colors, pool, width):
+        """
+        Searches the automorphisms with the branches off the trivial path run by the pool.
+        """
+        levels = []
+        while colors.partition.size != self.n:
+            x, y_all = self.__branch(colors)
+            levels.append((x, [y for y in y_all if y != x + self.n]))
+            self.base.append(x)
+            colors.individualise([x, x + self.n])
+            self.__refine(colors, len(self.base))
+
+        shared = SharedGraphs.create(self.pair[1])
+        try:
+            self.__search_levels(levels, shared.name, pool, width)
+        finally:
+            shared.close()
+            shared.unlink()
+
+    def __search_levels(self, levels, name, pool, width):
+        """
+        Searches the other images of the base points, deepest first.
+        """
+        for depth in reversed(range(len(levels))):
+            x, y_all = levels[depth]
+            path = self.base[:depth]
+            sequence = [(b, b + self.n) for b in path]
+
+            # orbits of the automorphisms found so far that fix the path
+            orbits, seen = Orbits(self.n), 0
+            explored = [x]
+            pending, running = deque(y_all), deque()
+            while len(pending) > 0 or len(running) > 0:
+                if len(running) > 0 and (len(running) >= width or len(pending) == 0):
+                    perm = running.popleft().get()
+                    if perm is not None:
+                        self.generators.append(perm)
+                    continue
+
+                y = pending.popleft()
+                while seen < len(self.generators):
+                    if all(self.generators[seen][u] == u for u in path):
+                        orbits.add(self.generators[seen])
+                    seen += 1
+                if any(orbits.same(u, y - self.n) for u in explored):
+                    continue
+                explored.append(y - self.n)
+                fixing = [perm for perm in self.generators if all(perm[u] == u for u in path)]
+                task = name, (self.invariants, self.depths), sequence + [(x, y)], fixing
+                running.append(pool.apply_async(GraphAut.search_branch, (task,)))
+
+    def __reset(self):
+        """
+        Returns the refined colouring of the pair (the same values for a vertex and its copy).
+        """
+        values = vertex_invariants(self.pair[0]) * 2 if self.invariants else None
+        colors = GraphFastRef(self.pair, self.compact).reset(values)
+        self.__refine(colors, 0)
+        return colors
+
+    def __refine(self, colors, depth):
+        """
+        Refines the colouring of the pair (stopping once it is unbalanced), at the chosen
+        depths by the colours of pairs of vertices of each graph as well.
+        """
+        colors.refine(pair=True)
+        if depth in self.depths and colors.balanced():
+            cell_of = colors.partition.cell_of
+            values = self.pairs.refine(cell_of[:self.n]).vertex_colours()
+            values += self.pairs.refine(cell_of[self.n:]).vertex_colours()
+            colors.split_by(values)
+            colors.refine(pair=True)
+
+    def __branch(self, colors):
+        """
+        Returns the vertex x to individualise, from the first smallest colour with more than
+        one vertex in each graph, and the candidates y in the copy (None if the colouring
+        turns out to be unbalanced).
+        """
+        partition = colors.partition
+        target, target_size = None, 0
+        for cell in partition.cells():
+            size = partition.cell_end[cell] - cell
+            if size > 2 and (target is None or size < target_size):
+                target, target_size = cell, size
+                if size == 4:
+                    break
+        if target is None:
+            return None
+        x = colors.first_vertex_of(self.pair[0], target)
+        y_all = colors.vertices_of(self.pair[1], target)
+        return None if x is None or len(y_all) == 0 else (x, y_all)
+
+    def __swaps(self):
+        """
+        Returns the transpositions that swap each twin with the next one of its class.
+        """
+        swaps = []
+        if self.twins is None:
+            return swaps
+        for twins in self.twins:
+            for u, v in zip(twins, twins[1:]):
+                swap = list(range(self.n))
+                swap[u], swap[v] = v, u
+                swaps.append(swap)
+        return swaps
+
+    def __mapping(self, colors):
+        """
+        Returns the automorphism defined by a discrete colouring of the pair
+        (None if a colour does not have one vertex in each graph after all).
+        """
+        perm = [0] * self.n
+        partition = colors.partition
+        for cell in partition.cells():
+            vertices = partition.vertices_of(cell)
+            if len(vertices) != 2:
+                return None
+            x, y = sorted(vertices)
+            if x >= self.n or y < self.n:
+                return None
+            perm[x] = y - self.n
+        return perm
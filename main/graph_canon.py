@@ -0,0 +1,196 @@
+from array import array
+from color_ref_fast import GraphFastRef
+from color_ref_pairs import GraphPairRef
+from compact_graph import CompactGraph
+from invariants import vertex_invariants
+from orbits import Orbits
+import zlib
+
+
+# version of the form of certificates, part of the keys of cached results (see ResultCache):
+# bump it whenever certificates change, so that results stored before are not reused
+CERTIFICATE_VERSION = 3
+
+# number of leaves kept to recognise automorphisms (as the hashes of their edge lists,
+# with their labellings)
+max_leaves = 10000
+
+
+class GraphCanon(object):
+    """
+    Usage of GraphCanon class:
+    canon = GraphCanon(compact)
+    canon = GraphCanon(compact, invariants=True)
+                                    starts from the colouring by vertex invariants (see invariants.py)
+    canon = GraphCanon(compact, depths=(0, 1))
+                                    refines pairs of vertices at these depths (0 is the root) as well
+                                    (see GraphPairRef, needs numpy)
+
+    canon.certificate()             returns a hashable certificate (equal iff graphs are isomorphic)
+    canon.labelling                 canonical label of each vertex id (after certificate())
+    canon.automorphisms             automorphisms found on the way (as lists of vertex ids)
+
+    The search individualises every vertex of the first smallest non-singleton colour
+    (refining after each step) and picks the leaf with the smallest traces and then the
+    smallest relabelled edge list. The trace of a node is a checksum of the splits made by its
+    refinement, which only depend on the structure of the graph (not on vertex order), so
+    only the children with the smallest trace are explored, and not even those if the
+    traces so far are larger than the ones of the best leaf. Unlike hash(), the checksum is
+    the same with every interpreter, so certificates can be cached between runs.
+
+    A leaf equal to one found before gives an automorphism, and the search jumps back to
+    where both leaves diverge. Vertices in the same orbit as an explored one (under the
+    automorphisms that fix the current path) lead to equivalent subtrees and are skipped.
+    """
+
+    def __init__(self, compact: CompactGraph, invariants=False, depths=()):
+        self.compact = compact
+        self.invariants = invariants
+        self.depths = depths
+        self.pairs = GraphPairRef(compact) if len(depths) > 0 else None
+        self.automorphisms = []
+
+    def certificate(self):
+        """
+        Returns the certificate: the number of vertices and the sorted edge list under
+        the canonical labelling (each edge {u, v} with u <= v encoded as u * n + v, so that
+        self-loops are kept).
+        """
+        values = vertex_invariants(self.compact) if self.invariants else None
+        colors = GraphFastRef([self.compact], self.compact).reset(values)
+        self.__refine(colors, 0)
+        self.leaves = {}
+        self.best = None
+        self.__search(colors, [], [])
+        self.labelling = self.best[1]
+        return self.compact.n, self.best[0]
+
+    def __search(self, colors, path, traces) -> int:
+        """
+        Explores the search tree below the current colouring.
+        :return: the depth to jump back to (the depth of `path` to continue)
+        """
+        partition = colors.partition
+        cell = self.__target_cell(partition)
+        if cell is None:
+            return self.__leaf(partition, path, traces)
+
+        # only children with the smallest trace can lead to the best leaf
+        children = {}
+        for v in partition.vertices_of(cell):
+            mark = colors.mark()
+            self.__individualise(colors, v, len(path) + 1)
+            children[v] = self.__trace(partition, mark)
+            colors.undo(mark)
+        trace = min(children.values())
+        traces = traces + [trace]
+        if self.best is not None and traces > self.best[3][:len(traces)]:
+            return len(path)
+
+        # orbits of the automorphisms found so far that fix the path
+        orbits, seen = None, 0
+        explored = []
+        for v in partition.vertices_of(cell):
+            if children[v] != trace:
+                continue
+            if len(explored) > 0:
+                while seen < len(self.automorphisms):
+                    perm = self.automorphisms[seen]
+                    seen += 1
+                    if all(perm[u] == u for u in path):
+                        if orbits is None:
+                            orbits = Orbits(self.compact.n)
+                        orbits.add(perm)
+                if orbits is not None and any(orbits.same(u, v) for u in explored):
+                    continue
+            explored.append(v)
+
+            mark = colors.mark()
+            self.__individualise(colors, v, len(path) + 1)
+            jump = self.__search(colors, path + [v], traces)
+            colors.undo(mark)
+            if jump < len(path):
+                return jump
+        return len(path)
+
+    def __individualise(self, colors, v, depth):
+        colors.individualise([v])
+        self.__refine(colors, depth)
+
+    def __refine(self, colors, depth):
+        """
+        Refines the colouring, at the chosen depths by the colours of pairs as well.
+        """
+        colors.refine()
+        if depth in self.depths:
+            cell_of = colors.partition.cell_of
+            colors.split_by(self.pairs.refine(cell_of).vertex_colours())
+            colors.refine()
+
+    def __trace(self, partition, mark) -> int:
+        """
+        Returns a checksum of the splits made since the mark.
+        """
+        splits = array('i')
+        for cell, starts in partition.trail[mark:]:
+            splits.append(cell)
+            splits.append(len(starts))
+            splits.extend(starts)
+        return zlib.crc32(splits)
+
+    def __target_cell(self, partition):
+        """
+        Returns the first smallest non-singleton colour (None if colouring is discrete).
+        """
+        target, target_size = None, 0
+        for cell in partition.cells():
+            size = partition.cell_end[cell] - cell
+            if size > 1 and (target is None or size < target_size):
+                target, target_size = cell, size
+                if size == 2:
+                    break
+        return target
+
+    def __leaf(self, partition, path, traces) -> int:
+        """
+        Compares the leaf with the leaves found so far. Only a hash of the edge list of
+        each leaf is kept with its labelling, and the edge list of a leaf with the same
+        hash is built again from its labelling to compare both.
+        """
+        n = self.compact.n
+        label = partition.position
+        edges = self.__edges(label)
+        key = hash(edges)
+
+        other = self.leaves.get(key)
+        if other is not None and self.__edges(other[0]) == edges:
+            # maps each vertex of the other leaf to the vertex with the same label
+            self.automorphisms.append([partition.elements[other[0][v]] for v in range(n)])
+            return self.__diverge(path, other[1])
+
+        if other is None and len(self.leaves) < max_leaves:
+            self.leaves[key] = label.copy(), path
+        if self.best is None or (traces, edges) < (self.best[3], self.best[0]):
+            self.best = edges, label.copy(), path, traces
+        return len(path)
+
+    def __edges(self, label) -> tuple:
+        """
+        Returns the sorted edge list of the graph relabelled by `label`.
+        """
+        n = self.compact.n
+        offsets, targets = self.compact.offsets, self.compact.targets
+        edges = []
+        for u in range(n):
+            lu = label[u]
+            for v in targets[offsets[u]:offsets[u + 1]]:
+                if lu <= label[v]:
+                    edges.append(lu * n + label[v])
+        edges.sort()
+        return tuple(edges)
+
+    def __diverge(self, path, other_path) -> int:
+        depth = 0
+        while depth < len(path) and path[depth] == other_path[depth]:
+            depth += 1
+        return depth
@@ -9,13 +9,52 @@ Includes functions for reading and writing graphs, in a very simple readable for
 # updated 5-2-2015: no black fill color used, when more than numcolors**2 vertices.
 # updated 29-1-2017: pep8 reformat, general improvements
 
+import bz2
+import gzip
+import io
+import lzma
+import mmap
+import multiprocessing
+import os
 import sys
-from typing import IO, Tuple, List, Union
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+from typing import IO, BinaryIO, Iterator, Optional, Tuple, List, Union
 
+from compact_graph import CompactGraph
 from graph import Graph, Edge
 
 DEFAULT_COLOR_SCHEME = "paired12"
 NUM_COLORS = 12
+BINARY_MAGIC = b'GRB1'
+INDEX_SUFFIX = '.idx'
+COMPRESSIONS = {'.gz': gzip.open, '.xz': lzma.open, '.bz2': bz2.open}
+
+# the block of shared graphs that this process has attached to last (see SharedGraphs.attach)
+attached = {}
+
+
+def open_graph_file(path: str, mode: str = 'r') -> IO:
+    """
+    Open a graph file, which is decompressed while it is read if it ends with .gz, .xz or .bz2
+    (so memory stays bounded when the graphs are read one by one)
+    :param path: The path of the file
+    :param mode: 'r' to read text, 'rb' to read bytes
+    :return: The file
+    """
+    compression = COMPRESSIONS.get(os.path.splitext(path)[1])
+    if compression is None:
+        return open(path, mode)
+    return compression(path, 'rt' if mode == 'r' else mode)
+
+
+def is_graph_list(path: str) -> bool:
+    """
+    Returns True iff the path is of a .grl file (possibly compressed)
+    """
+    if os.path.splitext(path)[1] in COMPRESSIONS:
+        path = os.path.splitext(path)[0]
+    return path.endswith('.grl')
 
 
 def read_line(f: IO[str]) -> str:
@@ -32,12 +71,13 @@ def read_line(f: IO[str]) -> str:
     return line
 
 
-def read_graph(graphclass, f: IO[str]) -> Tuple[Graph, List[str], bool]:
+def read_edge_list(f: IO[str]) -> Tuple[int, array, Optional[List[int]], List[str], bool]:
     """
-    Read a graph from a file
-    :param graphclass: The class of the graph
+    Read the next graph from a file without building it. The edge list is read in one pass
+    and (without weights) parsed at once.
     :param f: The file
-    :return: The graph
+    :return: The number of vertices, the ends of all edges (two per edge), their weights
+    (None if there are none), the options and whether another graph follows
     """
     options = []
 
@@ -45,38 +85,90 @@ def read_graph(graphclass, f: IO[str]) -> Tuple[Graph, List[str], bool]:
         try:
             line = read_line(f)
             n = int(line)
-            graph = graphclass(directed=False, n=n)
             break
         except ValueError:
-            if len(line) > 0 and line[-1] == '\n':
+            if len(line) == 0:
+                raise EOFError('No graph found before the end of the file')
+            if line[-1] == '\n':
                 options.append(line[:-1])
             else:
                 options.append(line)
 
-    line = read_line(f)
-    edges = []
-
-    try:
-        while True:
-            comma = line.find(',')
-            if ':' in line:
-                colon = line.find(':')
-                edges.append((int(line[:comma]), int(line[comma + 1:colon]), int(line[colon + 1:])))
+    # the edge list ends with the first line that is not an edge (edges may be indented)
+    lines = []
+    line = ''
+    for line in f:
+        if line[0] == '#':
+            continue
+        if not line.lstrip()[:1].isdigit():
+            break
+        lines.append(line)
+    else:
+        line = ''
+
+    weights = None
+    if any(':' in edge for edge in lines):
+        ends, weights = array('i'), []
+        for edge in lines:
+            comma, colon = edge.find(','), edge.find(':')
+            if colon == -1:
+                ends.extend((int(edge[:comma]), int(edge[comma + 1:])))
+                weights.append(None)
             else:
-                edges.append((int(line[:comma]), int(line[comma + 1:]), None))
-            line = read_line(f)
-    except Exception:
-        pass
+                ends.extend((int(edge[:comma]), int(edge[comma + 1:colon])))
+                weights.append(int(edge[colon + 1:]))
+    else:
+        ends = array('i', map(int, ','.join(lines).split(','))) if len(lines) > 0 else array('i')
 
-    indexed_nodes = list(graph.vertices)
+    return n, ends, weights, options, line != '' and line[0] == '-'
 
-    for edge in edges:
-        graph += Edge(indexed_nodes[edge[0]], indexed_nodes[edge[1]], edge[2])
 
-    if line != '' and line[0] == '-':
-        return graph, options, True
+def build_graph(graphclass, n: int, ends, weights: Optional[List[int]] = None) -> Graph:
+    """
+    Build a graph from the ends of its edges (see `read_edge_list`). The edges are added
+    without the checks of `Graph.add_edge`, unless the graph class overrides it.
+    """
+    graph = graphclass(directed=False, n=n)
+    vertices = graph.vertices
+    if weights is None:
+        graph._add_edges(Edge(vertices[ends[i]], vertices[ends[i + 1]]) for i in range(0, len(ends), 2))
     else:
-        return graph, options, False
+        graph._add_edges(Edge(vertices[ends[2 * i]], vertices[ends[2 * i + 1]], weight)
+                         for i, weight in enumerate(weights))
+    return graph
+
+
+def read_graph(graphclass, f: IO[str]) -> Tuple[Graph, List[str], bool]:
+    """
+    Read a graph from a file
+    :param graphclass: The class of the graph
+    :param f: The file
+    :return: The graph
+    """
+    n, ends, weights, options, cont = read_edge_list(f)
+    return build_graph(graphclass, n, ends, weights), options, cont
+
+
+def iter_graphs(f: IO[str], graph_class=Graph, options: List[str] = None) -> Iterator[Graph]:
+    """
+    Read the graphs of a list one by one (a separator after the last graph is ignored)
+    :param f: The file
+    :param graph_class: The class of the graphs
+    :param options: Optional, a list to which the options in the file are added
+    :return: An iterator over the graphs
+    """
+    cont, first = True, True
+    while cont:
+        try:
+            graph, new_options, cont = read_graph(graph_class, f)
+        except EOFError:
+            if first:
+                raise
+            return
+        first = False
+        if options is not None:
+            options += new_options
+        yield graph
 
 
 def read_graph_list(graph_class, f: IO[str]) -> Tuple[List[Graph], List[str]]:
@@ -87,25 +179,165 @@ def read_graph_list(graph_class, f: IO[str]) -> Tuple[List[Graph], List[str]]:
     :return: A list of graphs
     """
     options = []
-    graphs = []
-    cont = True
+    graphs = list(iter_graphs(f, graph_class, options))
+    return graphs, options
 
-    while cont:
-        graph, new_options, cont = read_graph(graph_class, f)
-        options += new_options
-        graphs.append(graph)
 
+def index_graph_list(path: str) -> List[int]:
+    """
+    Find where every graph of a .grl file starts (at the beginning of the file, or after a
+    line starting with '-'). The positions are cached in a sidecar file (the path with
+    INDEX_SUFFIX added), which is used as long as the size and modification time of the
+    file are the same.
+    :param path: The path of the file
+    :return: The byte offset of every graph
+    """
+    stat = os.stat(path)
+    key = [stat.st_mtime_ns, stat.st_size]
+    index = array('q')
+    try:
+        with open(path + INDEX_SUFFIX, 'rb') as f:
+            index.frombytes(f.read())
+        if index[:2].tolist() == key:
+            return index[2:].tolist()
+    except (OSError, ValueError):
+        pass
+
+    offsets = [0]
+    position = 0
+    blank = True
+    with open_graph_file(path, 'rb') as f:
+        for line in f:
+            position += len(line)
+            if line[:1] == b'-':
+                offsets.append(position)
+                blank = True
+            elif line.strip():
+                blank = False
+    # a separator at the end (followed by blank lines at most) starts no graph
+    if len(offsets) > 1 and blank:
+        offsets.pop()
+    try:
+        with open(path + INDEX_SUFFIX, 'wb') as f:
+            f.write(array('q', key + offsets).tobytes())
+    except OSError:
+        pass
+    return offsets
+
+
+class IndexedGraphs(object):
+    """
+    Lazily loaded list of the graphs of a .grl file (see `index_graph_list`):
+    graphs = IndexedGraphs(path)
+
+    len(graphs)                     number of graphs
+    graphs[i]                       parses and returns only the i-th graph
+    graphs[i:j]                     parses and returns only the graphs i..j-1
+    """
+
+    def __init__(self, path: str, graph_class=Graph):
+        self.path = path
+        self.graph_class = graph_class
+        self.offsets = index_graph_list(path)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Graph, List[Graph]]:
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            return self.__read(start, stop - start)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('graph index out of range')
+        return self.__read(i, 1)[0]
+
+    def __read(self, start: int, count: int) -> List[Graph]:
+        graph_list = []
+        if count <= 0:
+            return graph_list
+        with open_graph_file(self.path, 'rb') as f:
+            f.seek(self.offsets[start])
+            text = io.TextIOWrapper(f)
+            for graph in iter_graphs(text, self.graph_class):
+                graph_list.append(graph)
+                if len(graph_list) == count:
+                    break
+        return graph_list
+
+
+def read_edge_lists(args) -> List[tuple]:
+    """
+    Read `count` graphs from the byte offset of a file without building them
+    (the work of one process of `read_graph_list_parallel`).
+    :param args: The path of the file, the offset, the number of graphs and whether to
+    return them as CompactGraphs
+    :return: The number of vertices, edge ends, weights (or the CompactGraph instead of these)
+    and options of each graph
+    """
+    path, offset, count, compact = args
+    edge_lists = []
+    with open_graph_file(path, 'rb') as f:
+        f.seek(offset)
+        text = io.TextIOWrapper(f)
+        for _ in range(count):
+            n, ends, weights, options, _ = read_edge_list(text)
+            if compact:
+                edge_lists.append((CompactGraph.from_edges(n, ends), options))
+            else:
+                edge_lists.append((n, ends, weights, options))
+    return edge_lists
+
+
+def read_graph_list_parallel(graph_class, path: str, processes: Optional[int] = None,
+                             compact: bool = False) -> Tuple[List[Union[Graph, CompactGraph]], List[str]]:
+    """
+    Read a list of graphs from a file with a pool of processes. The file is split on graph
+    boundaries (see `index_graph_list`), and every process sends back its graphs as arrays
+    of edge ends, which are built into graphs in their original order.
+    :param graph_class: The graph class
+    :param path: The path of the file
+    :param processes: The number of processes (None for one per core)
+    :param compact: Whether the processes should return CompactGraphs, which skips building
+    `Graph` objects (the part that does not run in parallel)
+    :return: A list of graphs
+    """
+    offsets = index_graph_list(path)
+    processes = processes or os.cpu_count() or 1
+    size = max(1, len(offsets) // (4 * processes))
+    tasks = [(path, offsets[i], min(size, len(offsets) - i), compact) for i in range(0, len(offsets), size)]
+    with multiprocessing.Pool(processes) as pool:
+        chunks = pool.map(read_edge_lists, tasks)
+
+    graphs, options = [], []
+    for chunk in chunks:
+        for edge_list in chunk:
+            if compact:
+                graphs.append(edge_list[0])
+            else:
+                graphs.append(build_graph(graph_class, *edge_list[:3]))
+            options += edge_list[-1]
     return graphs, options
 
 
-def load_graph(f: IO[str], graph_class=Graph, read_list: bool = False) -> Union[Tuple[List[Graph], List[str]], Graph]:
+def load_graph(f: IO[str], graph_class=Graph, read_list: bool = False,
+               processes: Optional[int] = 1) -> Union[Tuple[List[Graph], List[str]], Graph]:
     """
     Load a graph from a file
     :param f: The file
     :param graph_class: The class of the graph. You may subclass the default graph class and add your own here.
     :param read_list: Specifies whether to read a list of graphs from the file, or just a single graph.
+    :param processes: The number of processes that read a list of graphs in parallel (None for one per core).
+    Only uncompressed files opened from a path can be read in parallel.
     :return: The graph, or a list of graphs.
     """
+    path = getattr(f, 'name', None)
+    if read_list and processes != 1 and isinstance(path, str) and os.path.isfile(path) \
+            and os.path.splitext(path)[1] not in COMPRESSIONS:
+        return read_graph_list_parallel(graph_class, path, processes)
     if read_list:
         graph_list, options = read_graph_list(graph_class, f)
         return graph_list, options
@@ -194,6 +426,213 @@ def print_graph(graph_list: Union[Graph, List[Graph]], options=[]):
         write_graph_list([graph_list], sys.stdout, options)
 
 
+def write_binary(graph_list: List[Graph], f: BinaryIO):
+    """
+    Write a list of graphs to a binary file: the magic bytes, the number of graphs k, the
+    first vertex and the first neighbour of every graph (k + 1 values each), the neighbour
+    offsets of every graph (one more than its number of vertices) and the concatenated
+    neighbour lists, all as little-endian int32 and with the vertices of every graph numbered
+    from 0. Edges are undirected and without weights, multi-edges are merged.
+    :param graph_list: The list of graphs
+    :param f: The file, opened in binary mode
+    """
+    f.write(BINARY_MAGIC)
+    for part in binary_parts(CompactGraph.from_graphs(graph_list)):
+        if sys.byteorder != 'little':
+            part = array('i', part)
+            part.byteswap()
+        f.write(part.tobytes())
+
+
+def binary_parts(compact: CompactGraph) -> List[array]:
+    """
+    Returns the arrays of the binary format of `write_binary` (after the magic bytes)
+    for the graphs of a CompactGraph.
+    """
+    k = len(compact.starts) - 1
+    starts = compact.starts
+    target_starts = array('i', [compact.offsets[v] for v in starts])
+    offsets = array('i')
+    targets = array('i')
+    for i in range(k):
+        start, end = starts[i], starts[i + 1]
+        offsets.extend(offset - target_starts[i] for offset in compact.offsets[start:end + 1])
+        targets.extend(v - start for v in compact.targets[target_starts[i]:target_starts[i + 1]])
+    return [array('i', [k]), array('i', starts), target_starts, offsets, targets]
+
+
+class BinaryGraphs(object):
+    """
+    Memory-mapped list of graphs in the binary format of `write_binary`:
+    graphs = BinaryGraphs(path)
+
+    len(graphs)                     number of graphs
+    graphs[i]                       the i-th graph as a CompactGraph (without copying its arrays)
+    graphs.graph(i)                 the i-th graph as a Graph
+    graphs.close()                  releases the file (see close)
+    with BinaryGraphs(path) as graphs:
+                                    closes the graphs at the end of the block
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:4] != BINARY_MAGIC:
+            self.mmap.close()
+            raise ValueError('Not a binary graph file: ' + path)
+
+        data = memoryview(self.mmap)[4:].cast('i')
+        if sys.byteorder != 'little':
+            data = array('i', data)
+            data.byteswap()
+        self._load(data)
+
+    def _load(self, data):
+        """
+        Locates the parts of the format in the integers that follow the magic bytes.
+        """
+        self.data = data
+        self.k = self.data[0]
+        self.starts = self.data[1:self.k + 2]
+        self.target_starts = self.data[self.k + 2:2 * self.k + 3]
+        self.offsets = 2 * self.k + 3
+        self.targets = self.offsets + self.starts[self.k] + self.k
+
+    def __len__(self) -> int:
+        return self.k
+
+    def __getitem__(self, i: int) -> CompactGraph:
+        if i < 0:
+            i += self.k
+        if not 0 <= i < self.k:
+            raise IndexError('graph index out of range')
+        first = self.offsets + self.starts[i] + i
+        offsets = self.data[first:first + self.starts[i + 1] - self.starts[i] + 1]
+        targets = self.data[self.targets + self.target_starts[i]:self.targets + self.target_starts[i + 1]]
+        return CompactGraph(offsets, targets)
+
+    def graph(self, i: int, graph_class=Graph) -> Graph:
+        compact = self[i]
+        graph = graph_class(directed=False, n=compact.n)
+        vertices = graph.vertices
+        graph._add_edges(Edge(vertices[u], vertices[v]) for u in range(compact.n)
+                         for v in compact.neighbours(u) if u <= v)
+        return graph
+
+    def close(self):
+        """
+        Releases the file. Graphs taken from it before stay readable, and the file is only
+        unmapped once the last of them is dropped.
+        """
+        self._release()
+        try:
+            self.mmap.close()
+        except BufferError:
+            pass
+        self.mmap = None
+
+    def _release(self):
+        """
+        Releases the views of the data (on big-endian hosts, the data is a swapped copy).
+        """
+        for part in (self.starts, self.target_starts, self.data):
+            if isinstance(part, memoryview):
+                part.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SharedGraphs(BinaryGraphs):
+    """
+    List of graphs in a block of shared memory, in the binary format of `write_binary`
+    (without the magic bytes, in native byte order), so that worker processes can read
+    them without copying or unpickling:
+    shared = SharedGraphs.create(compact)   copies the graphs of a CompactGraph into a new block
+    graphs = SharedGraphs.attach(name)      attaches to the block `shared.name` (once per process,
+                                            detaching from the one before)
+    pool = SharedGraphs.pool(processes)     returns a process pool for workers that attach to blocks
+
+    len(graphs)                     number of graphs
+    graphs[i]                       the i-th graph as a CompactGraph (without copying its arrays)
+    graphs.close()                  detaches from the block (see BinaryGraphs.close)
+    shared.unlink()                 frees the block (once, after the workers are done with it)
+    """
+
+    def __init__(self, name: str, memory: shared_memory.SharedMemory = None):
+        self.memory = memory if memory is not None else shared_memory.SharedMemory(name)
+        self.name = self.memory.name
+        self._load(self.memory.buf.cast('i'))
+
+    @staticmethod
+    def create(compact: CompactGraph) -> "SharedGraphs":
+        parts = binary_parts(compact)
+        size = sum(len(part) for part in parts) * parts[0].itemsize
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        data = memory.buf.cast('i')
+        position = 0
+        for part in parts:
+            data[position:position + len(part)] = part
+            position += len(part)
+        data.release()
+        return SharedGraphs(memory.name, memory)
+
+    @staticmethod
+    def pool(processes: Optional[int] = None) -> multiprocessing.Pool:
+        """
+        Returns a process pool whose workers can attach to shared graphs. The resource tracker
+        is started first, so the workers share it and do not free the blocks when they exit.
+        """
+        resource_tracker.ensure_running()
+        return multiprocessing.Pool(processes)
+
+    @staticmethod
+    def attach(name: str) -> "SharedGraphs":
+        """
+        Returns the block, attached once per process. A process only stays attached to the
+        block it reads last, so the blocks of earlier calls are freed once they are unlinked.
+        """
+        if name not in attached:
+            for other in list(attached.values()):
+                other.close()
+            attached[name] = SharedGraphs(name)
+        return attached[name]
+
+    def close(self):
+        attached.pop(self.name, None)
+        self._release()
+        try:
+            self.memory.close()
+        except BufferError:
+            pass
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+def convert_to_binary(text_path: str, binary_path: str):
+    """
+    Convert a .gr/.grl file to the binary format
+    """
+    with open_graph_file(text_path) as f:
+        graph_list = list(iter_graphs(f))
+    with open(binary_path, 'wb') as f:
+        write_binary(graph_list, f)
+
+
+def convert_from_binary(binary_path: str, text_path: str):
+    """
+    Convert a binary file back to a .grl file (or a .gr file, if it has a single graph)
+    """
+    with BinaryGraphs(binary_path) as graphs:
+        graph_list = [graphs.graph(i) for i in range(len(graphs))]
+    with open(text_path, 'w') as f:
+        write_graph_list(graph_list, f)
+
+
 def write_dot(graph: Graph, f: IO[str], directed=False):
     """
     Writes a given graph to a file in .dot format.
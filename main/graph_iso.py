@@ -1,146 +1,523 @@
 from color_ref_fast import GraphFastRef
 from color_ref import GraphColors
+from color_ref_pairs import GraphPairRef
+from compact_graph import CompactGraph
+from forest_canon import ForestCanon, is_forest
 from graph import Graph
-import sys
+from graph_aut import GraphAut
+from graph_canon import GraphCanon, CERTIFICATE_VERSION
+from graph_io import SharedGraphs
+from invariants import cascade, refined_stages, stages, vertex_invariants
+from lru_memo import LruMemo
+from math import factorial
+from perm_group import PermGroup
+from result_cache import ResultCache
+import os
+import time
 
 
 detect_forests = True
-detect_false_twins = True
+detect_components = True
+use_complement = True
+detect_twins = True
+use_invariants = True
+use_vertex_invariants = False
+
+# basic colour refinement (GraphColors) only groups the graphs: the searches of GraphCanon and
+# GraphAut always refine with GraphFastRef, which keeps the trail that they undo
 use_fast_refinement = True
 
+# graphs with at most this many vertices (0 for none) are refined by the colours of pairs of
+# vertices (2-WL, see GraphPairRef) as well: at the root, and at these depths of the searches
+max_pair_refinement_size = 0
+pair_refinement_depths = (0,)
+
+# automorphism groups of the components counted last, by their certificates, as generators
+# and base in canonical labels (shared by all GraphIso objects of the process, see LruMemo
+# for its size and statistics)
+memo = LruMemo(256)
+
+
+def split(compact: CompactGraph, components: bool) -> list[tuple]:
+    """
+    Returns the connected components of a graph (if `components` is set) as pairs of their
+    vertex ids in the graph and a compact graph.
+    """
+    vertices = compact.components() if components else [range(compact.n)]
+    if len(vertices) != 1:
+        return [(component, compact.subgraph(component)) for component in vertices]
+    return [(range(compact.n), compact)]
+
+
+def search_settings() -> tuple:
+    """
+    Returns the flags that change the refinement of searches, as they are passed on.
+    """
+    return use_vertex_invariants, max_pair_refinement_size, tuple(pair_refinement_depths)
+
+
+def search_options(n: int, settings: tuple) -> tuple:
+    """
+    Returns the options of GraphCanon and GraphAut for a graph with n vertices: whether to
+    start from vertex invariants and the depths at which to refine pairs of vertices.
+    """
+    invariants, max_size, depths = settings
+    if n > max_size or not GraphPairRef.available():
+        depths = ()
+    return invariants, depths
+
+
+def pair_histogram(compact: CompactGraph):
+    """
+    Returns the histogram of the colours of pairs of vertices of a graph
+    (None if it is not refined by pairs at the root).
+    """
+    if 0 not in search_options(compact.n, search_settings())[1]:
+        return None
+    return GraphPairRef(compact).refine().histogram()
+
+
+def certificates_of(args) -> list:
+    """
+    Returns the certificates, canonical labellings and automorphisms found of the connected
+    components of the i-th graph in a block of shared graphs (see SharedGraphs) and the
+    seconds they took. Takes the name of the block, i, whether to split the graph and the
+    search settings as one tuple, so it can be mapped over a pool.
+    """
+    name, i, components, settings = args
+    start = time.time()
+    compacts = split(SharedGraphs.attach(name)[i], components)
+    return [canonise(c, settings) for _, c in compacts], time.time() - start
+
+
+def canonise(compact: CompactGraph, settings: tuple) -> tuple:
+    """
+    Returns the certificate of a component, its canonical labelling and the automorphisms
+    that the search found on the way.
+    """
+    canon = GraphCanon(compact, *search_options(compact.n, settings))
+    return canon.certificate(), canon.labelling, canon.automorphisms
+
+
+def to_labels(perm, labelling) -> list[int]:
+    """
+    Returns a permutation of vertex ids as a permutation of their canonical labels.
+    """
+    labelled = [0] * len(perm)
+    for v, image in enumerate(perm):
+        labelled[labelling[v]] = labelling[image]
+    return labelled
+
+
+def from_labels(labelled, vertex_of) -> list[int]:
+    """
+    Returns a permutation of canonical labels as a permutation of vertex ids, given the
+    vertex id of each label.
+    """
+    perm = [0] * len(labelled)
+    for label, image in enumerate(labelled):
+        perm[vertex_of[label]] = vertex_of[image]
+    return perm
+
 
 class IsoGroup:
-    def __init__(self, graphs: set[Graph], count=0):
+    """
+    A group of isomorphic graphs with their number of automorphisms `count` and the
+    automorphism group `aut` of one of them, `graph` (after counting). For forests,
+    disconnected graphs and counts taken from the cache, the group is only built when
+    `aut` is first used.
+    """
+
+    def __init__(self, graphs: set[Graph], count=0, aut: PermGroup = None):
         self.graphs = graphs
         self.count = count
+        self.graph = None
+        self.build = None
+        self.__aut = aut
 
+    @property
+    def aut(self) -> PermGroup:
+        if self.__aut is None and self.build is not None:
+            self.__aut = self.build()
+        return self.__aut
 
-class GraphIso:
-    def __init__(self, graphs: set[Graph]):
-        self.graphs = graphs
+    @aut.setter
+    def aut(self, aut: PermGroup):
+        self.__aut = aut
 
-        # detect graph forests
-        if detect_forests:
-            self.forests = set(g for g in graphs if g.is_forest())
 
-        # detect false twins
-        if detect_false_twins:
-            self.false_twins = self.__false_twins()
-
-    def group(self, with_count=False):
-        grouped_graphs = set()
+class GraphIso:
+    """
+    Usage of GraphIso class:
+    iso = GraphIso(graphs, cache)
+
+    iso.group(with_count)           returns the groups of isomorphic graphs (IsoGroup)
+    iso.certificate(G)              returns the canonical certificate of one of the graphs
+    iso.count(G)                    returns the number of automorphisms of one of the graphs
+    iso.count(G, processes)         searches the automorphisms with a pool of processes
+    iso.automorphisms(G)            returns the automorphism group of one of the graphs
+
+    With a ResultCache, certificates and counts of graphs seen in earlier runs are taken
+    from it, and new ones are stored in it. Forests are not cached: they are fast, and
+    their certificates use codes shared by the graphs of one run.
+    """
+
+    def __init__(self, graphs: set[Graph], cache: ResultCache = None):
+        # graphs can come as a set as well, and are numbered in one fixed order
+        self.graphs = list(graphs)
+        self.index = {graph: i for i, graph in enumerate(self.graphs)}
+        self.compact = CompactGraph.from_graphs(self.graphs)
+        self.components = {}
+        self.cache = cache
+
+        # detect graph forests (they share the table of subtree codes)
+        self.forests = {}
+        if detect_forests:
+            codes = {}
+            for graph in graphs:
+                compact = self.compact.graph(self.index[graph])
+                if is_forest(compact):
+                    self.forests[graph] = ForestCanon(compact, codes)
+
+        # results depend on the graph, on the flags that change the form of certificates and
+        # on the version of that form
+        self.keys = {}
+        self.seconds = {}
+        if cache is not None:
+            settings = (CERTIFICATE_VERSION, detect_components, use_complement) + search_settings()
+            self.keys = {graph: cache.key(self.compact.graph(self.index[graph]), settings)
+                         for graph in graphs if graph not in self.forests}
+
+        # dense graphs are replaced by their complements (with the same automorphisms)
+        self.complemented = set()
+        if use_complement:
+            self.complemented = set(graph for graph in graphs if graph not in self.forests
+                                    and self.compact.is_dense(self.index[graph]))
+        if len(self.complemented) > 0:
+            compacts = [self.compact.graph(i) for i in range(len(graphs))]
+            for graph in self.complemented:
+                compacts[self.index[graph]] = compacts[self.index[graph]].complement()
+            self.compact = CompactGraph.union(compacts)
+
+    def group(self, with_count=False, processes=1, pool=None):
+        """
+        Returns the groups of isomorphic graphs (graphs that refinement already tells apart
+        from all others are left out). With `processes` other than 1, the certificates of
+        the candidates are computed by a pool of that many processes (None for one per CPU),
+        which also searches the branches of every automorphism search (see GraphAut); the
+        groups and their counts come out the same as with one process. A `pool` (from
+        SharedGraphs.pool) of that many processes is used instead of a new one if given.
+        """
         groups = []
 
-        # find all isomorphic groups
-        colorRef = GraphFastRef(self.graphs) \
-            if use_fast_refinement else GraphColors(self.graphs)
-        colors = colorRef.reset().refine()
-        for color_group in colors.group():
-            graphs = color_group.graphs
-            for i in range(len(graphs) - 1):
-                if graphs[i] in grouped_graphs:
-                    continue
-
-                # create a new isomorphic group
-                group = IsoGroup({graphs[i]})
+        # forests are grouped by their certificates right away
+        forest_groups = {}
+        for graph, forest in self.forests.items():
+            forest_groups.setdefault(forest.certificate(), []).append(graph)
+        for graphs in forest_groups.values():
+            if len(graphs) > 1:
+                group = IsoGroup(set(graphs))
                 groups.append(group)
-                for j in range(i + 1, len(graphs)):
-                    pair = [graphs[i], graphs[j]]
-                    main_branch = colors.copy(pair)
-
-                    # check if graphs are isomorphic
-                    isomorphic = False
-                    if with_count and group.count == 0:
-                        count = self.__count(pair, main_branch)
-                        if count > 0:
-                            group.count = count
-                            isomorphic = True
-                    else:
-                        count = self.__count(pair, main_branch, only_one=True)
-                        isomorphic = count == 1
-
-                    if isomorphic:
-                        group.graphs.add(graphs[j])
-                        grouped_graphs.add(graphs[j])
-        
-        # handle signle graph groups
-        for group in groups:
-            if len(group.graphs) == 1 and group.count == 0:
-                graph = list(group.graphs)[0]
-                pair = [graph, graph.deep_copy()]
-                new_count = GraphIso(pair).group(with_count=True)[0].count
-                group.count = new_count
-
-        return groups
-
-    def __count(self, graphs, colors, only_one=False):
+                if with_count:
+                    group.count = self.count(graphs[0])
+                    self.__defer(group, graphs[0])
+
+        # invariants that refinement checks as well (and density) separate most graphs,
+        # so only the others are refined
+        others = [graph for graph in self.graphs if graph not in self.forests]
+        compacts = [self.compact.graph(self.index[graph]) for graph in others]
+        dense = [graph in self.complemented for graph in others]
+        buckets = [[i for i in range(len(others)) if dense[i] == d] for d in (False, True)]
+        if use_invariants:
+            buckets = cascade(compacts, buckets, refined_stages)
+        colliding = [others[i] for bucket in buckets if len(bucket) > 1 for i in bucket]
+
+        # find all candidate groups among them
+        colorRef = GraphFastRef(self.graphs, self.compact) \
+            if use_fast_refinement else GraphColors(self.graphs, self.compact)
+        colors = colorRef.reset()
+        if len(colliding) < len(self.graphs):
+            colors = colors.copy(colliding)
+        if use_vertex_invariants:
+            values, refined = [None] * self.compact.n, set(colliding)
+            for graph, compact in zip(others, compacts):
+                if graph in refined:
+                    start = self.compact.starts[self.index[graph]]
+                    values[start:start + compact.n] = vertex_invariants(compact)
+            colors = colors.reset(values)
+        colors.refine()
+
+        # only graphs that share their colours with others are left, each bucket split by colours,
+        # so the costlier invariants below only compare graphs that refinement cannot tell apart
         color_groups = colors.group()
-        total_count = 0
-
-        # if coloring is unbalanced, there are no isomorphisms
-        if len(color_groups) == 0:
-            return 0
-
-        # if coloring defines a bijection, there is only 1 automorphism
-        if color_groups[0].discrete:
-            return 1
-
-        # branching rules: choosing the color class
-        color_set = color_groups[0].colors
-        branch_color = min(color_set, key=lambda c: color_set[c] if color_set[c] > 1 else sys.maxsize)
-
-        # get x and y vertices
-        y_all = colors.vertices_of(graphs[1], branch_color)
-        x = colors.first_vertex_of(graphs[0], branch_color)
-
-        # count isomorphisms for each possible branch
-        y_precounted = {}
-        for y in y_all:
-            if y in y_precounted:
-                total_count += y_precounted[y]
+        color_of = {graph: c for c, color_group in enumerate(color_groups) for graph in color_group.graphs}
+        parts = {}
+        for b, bucket in enumerate(buckets):
+            for i in bucket:
+                if others[i] in color_of:
+                    parts.setdefault((b, color_of[others[i]]), []).append(i)
+        buckets = list(parts.values())
+
+        # the other invariants split the candidates without computing certificates
+        if use_invariants:
+            buckets = cascade(compacts, buckets, stages, spectra=True)
+        # and so do the colours of pairs of vertices (of graphs small enough)
+        buckets = cascade(compacts, buckets, [pair_histogram])
+        bucket_of = {}
+        for b, bucket in enumerate(buckets):
+            for i in bucket:
+                bucket_of[others[i]] = b, dense[i]
+        candidates, found = [], []
+        for color_group in color_groups:
+            # a dense graph and a sparse one are never isomorphic, even if the complement
+            # of the first has the colours of the second
+            for d in (False, True):
+                graphs = [graph for graph in color_group.graphs if bucket_of[graph][1] == d]
+                if len(graphs) < 2:
+                    continue
+                parts = {}
+                for graph in graphs:
+                    parts.setdefault(bucket_of[graph], []).append(graph)
+                candidates += [part for part in parts.values() if len(part) > 1]
+                found += [(IsoGroup({part[0]}), part[0]) for part in parts.values() if len(part) == 1]
+
+        own = pool is None and processes != 1
+        if own:
+            pool = SharedGraphs.pool(processes)
+        try:
+            self.__certify([g for graphs in candidates for g in graphs], pool)
+            for graphs in candidates:
+                found += self.__group(graphs)
+            if with_count:
+                self.__count(found, pool, processes or os.cpu_count())
+        finally:
+            if own:
+                pool.close()
+                pool.join()
+
+        return groups + [group for group, _ in found]
+
+    def __group(self, graphs):
+        """
+        Groups graphs with the same colouring by their certificates.
+        :return: the groups, each with one of its graphs
+        """
+        certificates = {}
+        for graph in graphs:
+            certificate = self.certificate(graph)
+            if certificate not in certificates:
+                certificates[certificate] = []
+            certificates[certificate].append(graph)
+
+        # graphs are isomorphic iff their certificates are equal
+        return [(IsoGroup(set(graphs)), graphs[0]) for graphs in certificates.values()]
+
+    def __certify(self, graphs, pool):
+        """
+        Computes the certificates of the components of the graphs (in the pool, if any).
+        The workers read the graphs from shared memory.
+        """
+        graphs = [graph for graph in graphs
+                  if graph not in self.components and self.__cached(graph, 'certificate') is None]
+        if pool is None or len(graphs) < 2:
+            return
+        shared = SharedGraphs.create(self.compact)
+        try:
+            tasks = [(shared.name, self.index[graph], detect_components, search_settings())
+                     for graph in graphs]
+            for graph, (canonised, seconds) in zip(graphs, pool.map(certificates_of, tasks)):
+                compacts = split(self.compact.graph(self.index[graph]), detect_components)
+                self.components[graph] = [(certificate, compact, labelling, vertices, found)
+                                          for (certificate, labelling, found), (vertices, compact)
+                                          in zip(canonised, compacts)]
+                self.seconds[graph] = seconds
+        finally:
+            shared.close()
+            shared.unlink()
+
+    def __count(self, found, pool, width):
+        """
+        Counts the automorphisms of the groups (searching `width` branches at once in the
+        pool, if any), with their automorphism groups.
+        """
+        for group, graph in found:
+            group.count = self.__cached(graph, 'count')
+            if group.count is not None:
+                self.__defer(group, graph)
                 continue
-
-            # calculate isomorphisms for this branch
-            branch = colors.copy(graphs)
-            branch.assign(x, branch.next)
-            branch.assign(y, branch.next)
-
-            if use_fast_refinement:
-                next_color = branch.colors[branch.next]
-                branch.queue.append(next_color)
-
-            branch.next += 1
-            branch.refine()
-
-            # calculate isomorphisms for this branch
-            count = self.__count(graphs, branch, only_one)
-            if only_one and count == 1:
-                return 1
-
-            # copy results for forests
-            if detect_forests and graphs[0] in self.forests:
-                y_precounted = {v: count for v in y_all}
-
-            # copy results for false twins
-            if detect_false_twins:
-                for vertex in self.false_twins[y]:
-                    y_precounted[vertex] = count
-
-            total_count += count
-
-        return total_count
-
-    def __false_twins(self):
-        false_twins = {}
-        for graph in self.graphs:
-            for v1 in graph.vertices:
-                false_twins[v1] = set()
-                for v2 in graph.vertices:
-
-                    n1 = set(v1._incidence.keys())
-                    n2 = set(v2._incidence.keys())
-
-                    if v1 != v2 and n1 == n2 and not v1.is_adjacent(v2):
-                        false_twins[v1].add(v2)
-
-        return false_twins
+            start = time.time()
+            classes = self.__classes(graph, pool, width)
+            group.count = 1
+            for aut, copies in classes:
+                group.count *= aut.order() ** len(copies) * factorial(len(copies))
+            group.graph = graph
+            if len(classes) == 1 and len(classes[0][1]) == 1:
+                group.aut = classes[0][0]
+            else:
+                group.build = lambda graph=graph, classes=classes: self.__lift(graph, classes)
+            self.__store(graph, start, count=group.count)
+
+    def __defer(self, group: IsoGroup, graph: Graph):
+        """
+        Lets the group build the automorphism group of the graph when it is first used.
+        """
+        group.graph = graph
+        group.build = lambda: self.automorphisms(graph)
+
+    def certificate(self, graph: Graph):
+        """
+        Returns the canonical certificate of one of the graphs
+        (for disconnected graphs, the sorted certificates of the components).
+        """
+        if graph in self.forests:
+            return self.forests[graph].certificate()
+        certificate = self.__cached(graph, 'certificate')
+        if certificate is not None:
+            return certificate
+
+        start = time.time()
+        components = self.__components(graph)
+        if len(components) == 1:
+            certificate = components[0][0]
+        else:
+            certificate = 'components', tuple(sorted(component[0] for component in components))
+        if graph in self.complemented:
+            certificate = 'complement', certificate
+        self.__store(graph, start, certificate=certificate)
+        return certificate
+
+    def count(self, graph: Graph, processes=1, pool=None) -> int:
+        """
+        Returns the number of automorphisms of one of the graphs. With `processes` other than
+        1, the branches of the automorphism searches are searched by a pool of that many
+        processes (None for one per CPU), or by the given `pool`, as in group().
+        """
+        if graph in self.forests:
+            return self.forests[graph].count()
+        count = self.__cached(graph, 'count')
+        if count is not None:
+            return count
+
+        # automorphisms of every component, which can be permuted among identical ones
+        start = time.time()
+        own = pool is None and processes != 1
+        if own:
+            pool = SharedGraphs.pool(processes)
+        try:
+            classes = self.__classes(graph, pool, processes or os.cpu_count())
+        finally:
+            if own:
+                pool.close()
+                pool.join()
+        count = 1
+        for aut, copies in classes:
+            count *= aut.order() ** len(copies) * factorial(len(copies))
+        self.__store(graph, start, count=count)
+        return count
+
+    def automorphisms(self, graph: Graph) -> PermGroup:
+        """
+        Returns the automorphism group of one of the graphs (on its vertex indices).
+        """
+        if graph in self.forests:
+            return PermGroup(len(graph.vertices), self.forests[graph].generators())
+        return self.__lift(graph, self.__classes(graph))
+
+    def __classes(self, graph: Graph, pool=None, width=1) -> list[tuple]:
+        """
+        Returns the automorphism group of one component of each class of identical components,
+        with the canonical labellings and vertex ids of all components of the class.
+        """
+        identical = {}
+        for certificate, compact, labelling, vertices, found in self.__components(graph):
+            identical.setdefault(certificate, []).append((compact, labelling, vertices, found))
+        return [(self.__count_component(certificate, copies[0][0], copies[0][1], copies[0][3], pool, width)[1],
+                 [(labelling, vertices) for _, labelling, vertices, _ in copies])
+                for certificate, copies in identical.items()]
+
+    @staticmethod
+    def __lift(graph: Graph, classes) -> PermGroup:
+        """
+        Returns the automorphism group of a graph from the groups of its classes of identical
+        components: the generators of the first component of every class, and the swaps of
+        consecutive components of a class (matching vertices with the same canonical label).
+        """
+        n = len(graph.vertices)
+        if len(classes) == 1 and len(classes[0][1]) == 1 and len(classes[0][1][0][1]) == n:
+            return classes[0][0]
+        generators = []
+        for aut, copies in classes:
+            _, vertices = copies[0]
+            for g in aut.generators:
+                perm = list(range(n))
+                for i, image in enumerate(g):
+                    perm[vertices[i]] = vertices[image]
+                generators.append(perm)
+            for (labelling, vertices), (other_labelling, other_vertices) in zip(copies, copies[1:]):
+                vertex_of = [0] * len(other_labelling)
+                for i, label in enumerate(other_labelling):
+                    vertex_of[label] = other_vertices[i]
+                perm = list(range(n))
+                for i, label in enumerate(labelling):
+                    perm[vertices[i]] = vertex_of[label]
+                    perm[vertex_of[label]] = vertices[i]
+                generators.append(perm)
+        return PermGroup(n, generators)
+
+    def __automorphisms(self, compact: CompactGraph, found=(), pool=None, width=1) -> PermGroup:
+        twins = compact.twins() if detect_twins else None
+        options = search_options(compact.n, search_settings())
+        return GraphAut(compact, twins, *options, automorphisms=found).group(pool, width)
+
+    def __count_component(self, certificate, compact: CompactGraph, labelling, found=(), pool=None, width=1):
+        """
+        Returns the number of automorphisms of a component and its automorphism group. The
+        search starts from the automorphisms `found` by the canonical labelling, and the
+        group of an isomorphic component counted shortly before is relabelled instead.
+        """
+        memoised = memo.get(certificate)
+        if memoised is not None:
+            generators, base = memoised
+            vertex_of = [0] * compact.n
+            for v, label in enumerate(labelling):
+                vertex_of[label] = v
+            aut = PermGroup(compact.n, [from_labels(g, vertex_of) for g in generators],
+                            [vertex_of[b] for b in base], strong=True)
+            return aut.order(), aut
+        aut = self.__automorphisms(compact, found, pool, width)
+        memo.put(certificate, ([to_labels(g, labelling) for g in aut.generators],
+                               [labelling[b] for b in aut.base]))
+        return aut.order(), aut
+
+    def __components(self, graph: Graph):
+        """
+        Returns the certificate, the compact graph, the canonical labelling, the vertex ids
+        (in the graph) and the automorphisms found by the canonical labelling of every
+        connected component.
+        """
+        if graph not in self.components:
+            compacts = split(self.compact.graph(self.index[graph]), detect_components)
+            settings = search_settings()
+            self.components[graph] = []
+            for vertices, c in compacts:
+                certificate, labelling, found = canonise(c, settings)
+                self.components[graph].append((certificate, c, labelling, vertices, found))
+        return self.components[graph]
+
+    def __cached(self, graph: Graph, result: str):
+        """
+        Returns a result ('certificate' or 'count') of the graph from the cache (or None).
+        """
+        if graph not in self.keys:
+            return None
+        key = self.keys[graph]
+        return self.cache.certificate(key) if result == 'certificate' else self.cache.count(key)
+
+    def __store(self, graph: Graph, start: float, **results):
+        """
+        Stores results of the graph in the cache, with the time since `start` (plus the time
+        the workers took).
+        """
+        if graph in self.keys:
+            seconds = time.time() - start + self.seconds.pop(graph, 0)
+            self.cache.store(self.keys[graph], seconds, **results)
@@ -0,0 +1,159 @@
+from compact_graph import CompactGraph
+from orbits import Orbits
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# graphs with more vertices are not compared by their spectra
+max_spectrum_size = 500
+
+# eigenvalues closer than this are taken to be equal
+spectrum_tolerance = 1e-6
+
+# graphs with more vertices get their vertex invariants without matrices
+max_matrix_size = 1000
+
+
+def size(compact: CompactGraph):
+    return compact.n, len(compact.targets)
+
+
+def degree_sequence(compact: CompactGraph):
+    return tuple(sorted(compact.degrees))
+
+
+def triangles(compact: CompactGraph):
+    """
+    Returns the sorted numbers of triangles at every vertex.
+    """
+    neighbours = [set(compact.neighbours(v)) for v in range(compact.n)]
+    count = [0] * compact.n
+    for u in range(compact.n):
+        for v in neighbours[u]:
+            if u < v:
+                common = len(neighbours[u] & neighbours[v])
+                count[u] += common
+                count[v] += common
+    return tuple(sorted(count))
+
+
+def component_sizes(compact: CompactGraph):
+    return tuple(sorted(len(component) for component in compact.components()))
+
+
+def spectrum(compact: CompactGraph):
+    """
+    Returns the sorted eigenvalues of the adjacency matrix (needs numpy).
+    """
+    rows = numpy.repeat(numpy.arange(compact.n), numpy.asarray(compact.degrees))
+    adjacency = numpy.zeros((compact.n, compact.n))
+    adjacency[rows, numpy.asarray(compact.targets, dtype=numpy.int64)] = 1
+    return numpy.linalg.eigvalsh(adjacency)
+
+
+def vertex_invariants(compact: CompactGraph) -> list[tuple]:
+    """
+    Returns for every vertex the numbers of triangles and of 4-cycles through it, of
+    vertices at distance 2 and of 4-cliques containing it (self-loops are ignored).
+    Uses matrix products if numpy is there and the graph is small enough.
+    """
+    if numpy is not None and 0 < compact.n <= max_matrix_size:
+        return vertex_invariants_matrix(compact)
+    neighbours = [set(compact.neighbours(v)) - {v} for v in range(compact.n)]
+    values = []
+    for v in range(compact.n):
+        near = neighbours[v]
+
+        # number of common neighbours with every other vertex (paths of length 2)
+        common = {}
+        for u in near:
+            for w in neighbours[u]:
+                common[w] = common.get(w, 0) + 1
+        common.pop(v, None)
+
+        triangles, cliques = 0, 0
+        for u in near:
+            for w in near & neighbours[u]:
+                if u < w:
+                    triangles += 1
+                    cliques += sum(1 for x in near & neighbours[u] & neighbours[w] if w < x)
+        walks = sum(c * c for c in common.values()) - sum(len(neighbours[u]) - 1 for u in near)
+        distance2 = sum(1 for w in common if w not in near)
+        values.append((triangles, walks // 2, distance2, cliques))
+    return values
+
+
+def vertex_invariants_matrix(compact: CompactGraph) -> list[tuple]:
+    """
+    Returns the same values as vertex_invariants, from powers of the adjacency matrix.
+    """
+    n = compact.n
+    rows = numpy.repeat(numpy.arange(n), numpy.asarray(compact.degrees))
+    adjacency = numpy.zeros((n, n))
+    adjacency[rows, numpy.asarray(compact.targets, dtype=numpy.int64)] = 1
+    numpy.fill_diagonal(adjacency, 0)
+    degrees = adjacency.sum(axis=1)
+    paths = adjacency @ adjacency
+    numpy.fill_diagonal(paths, 0)
+
+    triangles = (paths * adjacency).sum(axis=1) / 2
+    squares = ((paths * paths).sum(axis=1) - adjacency @ (degrees - 1)) / 2
+    distance2 = ((paths > 0) & (adjacency == 0)).sum(axis=1)
+    cliques = numpy.zeros(n)
+    for v in range(n):
+        near = numpy.flatnonzero(adjacency[v])
+        if len(near) > 2:
+            inner = adjacency[numpy.ix_(near, near)]
+            cliques[v] = ((inner @ inner) * inner).sum() / 6
+    columns = [numpy.rint(c).astype(numpy.int64).tolist() for c in (triangles, squares, distance2, cliques)]
+    return list(zip(*columns))
+
+
+# invariants that colour refinement tells apart as well, from the cheapest
+refined_stages = [size, degree_sequence]
+
+# invariants that colour refinement may not tell apart, from the cheapest
+stages = [triangles, component_sizes]
+
+
+def cascade(compacts: list[CompactGraph], buckets: list[list[int]], stages, spectra=False) -> list[list[int]]:
+    """
+    Splits the buckets of graphs (by index) further into buckets that no invariant tells
+    apart, computing every invariant only for the graphs that the cheaper ones left in a
+    bucket with others. Isomorphic graphs always end up in the same bucket.
+    :param spectra: whether to compare the spectra at the end as well (needs numpy)
+    """
+    for invariant in stages:
+        buckets = [part for bucket in buckets
+                   for part in (split(bucket, lambda i: invariant(compacts[i])) if len(bucket) > 1 else [bucket])]
+    if spectra and numpy is not None:
+        buckets = [part for bucket in buckets
+                   for part in (split_spectra(bucket, compacts) if len(bucket) > 1 else [bucket])]
+    return buckets
+
+
+def split(bucket: list[int], invariant) -> list[list[int]]:
+    parts = {}
+    for i in bucket:
+        parts.setdefault(invariant(i), []).append(i)
+    return list(parts.values())
+
+
+def split_spectra(bucket: list[int], compacts: list[CompactGraph]) -> list[list[int]]:
+    """
+    Splits the graphs by their spectra. Graphs with spectra equal up to the tolerance stay
+    together, as do all graphs linked by such pairs, so rounding never separates
+    isomorphic graphs.
+    """
+    if compacts[bucket[0]].n > max_spectrum_size:
+        return [bucket]
+    spectra = [spectrum(compacts[i]) for i in bucket]
+    linked = Orbits(len(bucket))
+    for a in range(len(bucket)):
+        for b in range(a + 1, len(bucket)):
+            if numpy.allclose(spectra[a], spectra[b], rtol=0, atol=spectrum_tolerance):
+                linked.union(a, b)
+    return [[bucket[a] for a in orbit] for orbit in linked.all()]
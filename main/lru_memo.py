@@ -0,0 +1,43 @@
+from collections import OrderedDict
+
+
+class LruMemo(object):
+    """
+    Usage of LruMemo class (a bounded memo that drops the least recently used values):
+    memo = LruMemo(size)
+
+    memo.get(key)                   returns the value stored for the key (or None)
+    memo.put(key, value)            stores a value, dropping the oldest one if the memo is full
+    memo.resize(size)               changes the number of values kept (0 keeps none)
+    memo.hits, memo.misses          numbers of successful and failed lookups so far
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, key):
+        if key not in self.values:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.values.move_to_end(key)
+        return self.values[key]
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        self.values[key] = value
+        self.values.move_to_end(key)
+        while len(self.values) > self.size:
+            self.values.popitem(last=False)
+
+    def resize(self, size: int):
+        self.size = size
+        while len(self.values) > max(size, 0):
+            self.values.popitem(last=False)
@@ -0,0 +1,56 @@
+class Orbits(object):
+    """
+    Usage of Orbits class (union-find over vertex ids 0..n-1):
+    orbits = Orbits(n)
+
+    orbits.add(P)                   merges the orbits of the permutation P (list of images)
+    orbits.union(U, V)              merges the orbits of two vertices
+    orbits.find(V)                  returns the representative of the orbit of a vertex
+    orbits.same(U, V)               returns whether two vertices are in the same orbit
+    orbits.all()                    returns the orbits as lists of vertices
+    """
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, v: int) -> int:
+        parent = self.parent
+        root = v
+        while parent[root] != root:
+            root = parent[root]
+        while parent[v] != root:
+            parent[v], v = root, parent[v]
+        return root
+
+    def union(self, u: int, v: int) -> bool:
+        """
+        :return: whether two different orbits were merged
+        """
+        u, v = self.find(u), self.find(v)
+        if u == v:
+            return False
+        if self.size[u] < self.size[v]:
+            u, v = v, u
+        self.parent[v] = u
+        self.size[u] += self.size[v]
+        return True
+
+    def add(self, perm) -> bool:
+        """
+        :return: whether any orbits were merged
+        """
+        merged = False
+        for v, image in enumerate(perm):
+            if v != image and self.union(v, image):
+                merged = True
+        return merged
+
+    def same(self, u: int, v: int) -> bool:
+        return self.find(u) == self.find(v)
+
+    def all(self) -> list[list[int]]:
+        orbits = {}
+        for v in range(len(self.parent)):
+            orbits.setdefault(self.find(v), []).append(v)
+        return list(orbits.values())
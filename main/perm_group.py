@@ -0,0 +1,142 @@
+from orbits import Orbits
+
+
+def compose(p, q):
+    """
+    Returns the permutation that applies `p` first and then `q`.
+    """
+    return [q[i] for i in p]
+
+
+def inverse(p):
+    inv = [0] * len(p)
+    for i, image in enumerate(p):
+        inv[image] = i
+    return inv
+
+
+def is_identity(p) -> bool:
+    return all(i == image for i, image in enumerate(p))
+
+
+class PermGroup(object):
+    """
+    Usage of PermGroup class (permutations are lists of images of 0..n-1):
+    group = PermGroup(n, [P1, P2, ...])
+
+    group.generators                the generators of the group
+    group.base                      base points of the stabilizer chain
+    group.order()                   returns the number of elements
+    group.orbits()                  returns the orbits of the group
+    group.contains(P)               returns whether P is an element of the group
+
+    The stabilizer chain is computed with the Schreier-Sims algorithm. If the given base
+    and generators are already known to be a base and a strong generating set (that is,
+    the generators fixing the first i base points generate the stabilizer of these
+    points), pass strong=True to skip sifting the Schreier generators.
+    """
+
+    def __init__(self, n: int, generators, base=(), strong=False):
+        self.n = n
+        self.generators = [list(g) for g in generators if not is_identity(g)]
+        self.base = []
+        self.strong = []
+        self.transversals = []
+        self.__schreier_sims(list(base), strong)
+
+    def order(self) -> int:
+        order = 1
+        for transversal in self.transversals:
+            order *= len(transversal)
+        return order
+
+    def orbits(self) -> list[list[int]]:
+        orbits = Orbits(self.n)
+        for g in self.generators:
+            orbits.add(g)
+        return orbits.all()
+
+    def contains(self, perm) -> bool:
+        residue, _ = self.__sift(list(perm), 0)
+        return is_identity(residue)
+
+    def __sift(self, perm, level):
+        """
+        Divides out the transversal elements from `level` on.
+        :return: the residue and the level where it left the chain
+        """
+        for i in range(level, len(self.base)):
+            image = perm[self.base[i]]
+            if image not in self.transversals[i]:
+                return perm, i
+            perm = compose(perm, inverse(self.transversals[i][image]))
+        return perm, len(self.base)
+
+    def __transversal(self, level):
+        """
+        Maps each point of the orbit of the base point to an element that moves it there.
+        """
+        point = self.base[level]
+        transversal = {point: list(range(self.n))}
+        queue = [point]
+        for p in queue:
+            for g in self.strong[level]:
+                image = g[p]
+                if image not in transversal:
+                    transversal[image] = compose(transversal[p], g)
+                    queue.append(image)
+        return transversal
+
+    def __add_level(self, perm):
+        """
+        Extends the base with a point moved by the permutation.
+        """
+        self.base.append(next(i for i, image in enumerate(perm) if i != image))
+        self.strong.append([])
+        self.transversals.append(None)
+
+    def __schreier_sims(self, base, strong):
+        self.base = base
+        for g in self.generators:
+            if all(g[b] == b for b in self.base):
+                self.base.append(next(i for i, image in enumerate(g) if i != image))
+
+        for i in range(len(self.base)):
+            fixed = self.base[:i]
+            self.strong.append([g for g in self.generators if all(g[b] == b for b in fixed)])
+            self.transversals.append(None)
+            self.transversals[i] = self.__transversal(i)
+        if strong:
+            return
+
+        # sift the Schreier generators of every level, deepest first
+        i = len(self.base) - 1
+        while i >= 0:
+            residue, j = self.__schreier_residue(i)
+            if residue is None:
+                i -= 1
+                continue
+            if j == len(self.base):
+                self.__add_level(residue)
+            for level in range(i + 1, j + 1):
+                self.strong[level].append(residue)
+                self.transversals[level] = self.__transversal(level)
+            i = j
+
+    def __schreier_residue(self, i):
+        """
+        Returns the first Schreier generator of level i that does not sift through
+        the levels below it (with the level where it stopped), or None.
+        """
+        transversal = self.transversals[i]
+        for point, u in transversal.items():
+            for g in self.strong[i]:
+                # u * g * (representative of the image)^-1 fixes the base point
+                h = compose(u, g)
+                v = transversal[g[point]]
+                if h == v:
+                    continue
+                residue, j = self.__sift(compose(h, inverse(v)), i + 1)
+                if not is_identity(residue):
+                    return residue, j
+        return None, i
@@ -0,0 +1,71 @@
+from compact_graph import CompactGraph
+import ast
+import hashlib
+import sqlite3
+
+
+class ResultCache(object):
+    """
+    Usage of ResultCache class (results of graphs kept in a sqlite file between runs):
+    cache = ResultCache(path)
+
+    cache.key(compact, settings)    returns the hash of the edge lists of a graph and the settings
+    cache.certificate(key)          returns the stored certificate of a graph (or None)
+    cache.count(key)                returns the stored number of automorphisms (or None)
+    cache.store(key, seconds, certificate=None, count=None)
+                                    stores results of a graph and adds the seconds they took
+    cache.close()                   closes the file
+
+    Graphs are identified by their content (vertex numbering included), so a result is
+    reused for the same graph in any file. The settings that change the form of results
+    (e.g. the flags of graph_iso, and the version of certificates) are part of the key.
+    Certificates have to be canonical on their own, which rules out those that depend on
+    other graphs of the run. They are stored as their repr and read back as literals
+    (tuples of strings and numbers), so a cache file cannot run code when it is loaded.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                                'key TEXT PRIMARY KEY, certificate TEXT, count TEXT, seconds REAL)')
+
+    @staticmethod
+    def key(compact: CompactGraph, settings=()) -> str:
+        digest = hashlib.sha256(repr(tuple(settings)).encode())
+        digest.update(bytes(memoryview(compact.offsets).cast('B')))
+        digest.update(bytes(memoryview(compact.targets).cast('B')))
+        return digest.hexdigest()
+
+    def certificate(self, key: str):
+        row = self.__row(key)
+        return None if row is None or row[0] is None else ast.literal_eval(row[0])
+
+    def count(self, key: str):
+        row = self.__row(key)
+        return None if row is None or row[1] is None else int(row[1])
+
+    def store(self, key: str, seconds: float, certificate=None, count: int = None):
+        """
+        Stores the given results of a graph (keeping the ones stored before) right away,
+        so they are kept even if the run is interrupted.
+        """
+        certificate = None if certificate is None else repr(certificate)
+        count = None if count is None else str(count)
+        self.connection.execute('INSERT INTO results VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                                'certificate = COALESCE(excluded.certificate, certificate), '
+                                'count = COALESCE(excluded.count, count), '
+                                'seconds = seconds + excluded.seconds',
+                                (key, certificate, count, seconds))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __row(self, key: str):
+        return self.connection.execute('SELECT certificate, count FROM results WHERE key = ?', (key,)).fetchone()
@@ -6,6 +6,7 @@ sys.path.append(os.path.abspath('test'))
 
 from test_utils import format_groups, test
 from graph_iso import GraphIso
+import graph_iso
 from graph import Graph
 
 
@@ -13,29 +14,36 @@ expected_path = 'test/branching/test_expected.txt'
 output_path = 'test/branching/test_actual.txt'
 samples_path = 'test/branching/samples/'
 graph_files = [
-    # 'torus24.grl',
-    # 'torus72.grl',
-    # 'torus144.grl',
-    # 'products72.grl',
-    # 'products216.grl',
-    # 'cographs1.grl',
-    # 'trees11.grl',
-    # 'trees36.grl',
-    # 'trees90.grl',
+    'torus24.grl',
+    'torus72.grl',
+    'torus144.grl',
+    'products72.grl',
+    'products216.grl',
+    'cographs1.grl',
+    'trees11.grl',
+    'trees36.grl',
+    'trees90.grl',
     'modulesC.grl',
-    # 'modulesD.grl',
-    # 'cubes3.grl',
-    # 'cubes5.grl',
-    # 'cubes6.grl',
-    # 'cubes7.grl',
-    # 'cubes9.grl',
-    # 'bigtrees1.grl',
-    # 'bigtrees2.grl',
-    # 'bigtrees3.grl',
-    # 'wheeljoin14.grl',
-    # 'wheeljoin33.grl',
-    # 'wheelstar12.grl',
-    # 'wheelstar15.grl',
+    'modulesD.grl',
+    'cubes3.grl',
+    'cubes5.grl',
+    'cubes6.grl',
+    'cubes7.grl',
+    'cubes9.grl',
+    'bigtrees1.grl',
+    'bigtrees2.grl',
+    'bigtrees3.grl',
+    'wheeljoin14.grl',
+    'wheeljoin33.grl',
+    'wheelstar12.grl',
+    'wheelstar15.grl',
+    'loops.grl',
+]
+# counted again with the colours of pairs of vertices (2-WL) refined at the root and one level below
+pair_graph_files = [
+    'torus24.grl',
+    'products72.grl',
+    'cubes5.grl',
 ]
 
 
@@ -49,6 +57,13 @@ def iso_groups_out(f, graphs, groups):
 def iso_groups(graphs: set[Graph]):
     return GraphIso(graphs).group(with_count=True)
 
+def iso_groups_pairs(graphs: set[Graph]):
+    graph_iso.max_pair_refinement_size, graph_iso.pair_refinement_depths = 1000, (0, 1)
+    try:
+        return GraphIso(graphs).group(with_count=True)
+    finally:
+        graph_iso.max_pair_refinement_size, graph_iso.pair_refinement_depths = 0, (0,)
+
 
 if __name__ == "__main__":
     f = open(expected_path, "r")
@@ -59,6 +74,10 @@ if __name__ == "__main__":
         graph_files, 
         iso_groups,
         iso_groups_out
+    ), (
+        pair_graph_files,
+        iso_groups_pairs,
+        iso_groups_out
     )], expected)
 
     with open(output_path, 'w') as f:
@@ -1,33 +1,82 @@
-import sys, os
+import sys, os, math, time
 
+from termcolor import colored
 
 # appends the system path to the graph files
 sys.path.append(os.path.abspath('main'))
 sys.path.append(os.path.abspath('test'))
 
 from color_ref_fast import GraphFastRef
+from compact_graph import CompactGraph
 from test_utils import test
 
 
+samples_path = 'test/color-ref-fast/samples/'
+graph_files = [
+    'threepaths5.gr',
+    'threepaths10.gr',
+    'threepaths20.gr',
+    'threepaths40.gr',
+    'threepaths80.gr',
+    'threepaths160.gr',
+    'threepaths320.gr',
+    'threepaths640.gr',
+    'threepaths1280.gr',
+    'threepaths2560.gr',
+    'threepaths5120.gr',
+    'threepaths10240.gr',
+]
+
+# refinement should be O((n + m) log n), so doubling the input
+# must not come close to quadrupling the time (which is quadratic)
+max_exponent = 1.5
+min_time = 0.005
+repeats = 3
+
+
 def fast_ref(graph):
-    GraphFastRef([graph]).reset().refine()
+    compact = CompactGraph.from_graphs([graph])
+    best_time = None
+    for _ in range(repeats):
+        start_time = time.time()
+        GraphFastRef([graph], compact).reset().refine()
+        exec_time = time.time() - start_time
+        best_time = exec_time if best_time is None else min(best_time, exec_time)
+    return compact.n + len(compact.targets) // 2, best_time
+
+
+def fast_ref_out(f, graph, res):
+    return '{} {} {}'.format(f, *res)
+
+
+def scaling(output):
+    """
+    Fits the exponent k in time ~ size^k (least squares on a log-log scale)
+    over the inputs that take long enough to be measured.
+    """
+    print('size\ttime\tfile')
+    points = []
+    for line in output.strip().split('\n'):
+        f, size, exec_time = line.split()
+        size, exec_time = int(size), float(exec_time)
+        print('{}\t{:.3f}s\t{}'.format(size, exec_time, f))
+        if exec_time >= min_time:
+            points.append((math.log(size), math.log(exec_time)))
+
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    exponent = sum((x - mean_x) * (y - mean_y) for x, y in points) \
+        / sum((x - mean_x) ** 2 for x, _ in points)
+
+    line = '\nexponent:\t%.2f\t' % exponent
+    line += colored('SUCCESS', 'green') if exponent < max_exponent \
+        else colored('FAILED', 'red')
+    print(line)
 
 
 if __name__ == '__main__':
-    test('test/color-ref-fast/samples/', [([
-        'threepaths5.gr',
-        'threepaths10.gr',
-        'threepaths20.gr',
-        'threepaths40.gr',
-        'threepaths80.gr',
-        'threepaths160.gr',
-        'threepaths320.gr',
-        'threepaths640.gr',
-        'threepaths1280.gr',
-        'threepaths2560.gr',
-        'threepaths5120.gr',
-        'threepaths10240.gr',
-    ],
+    scaling(test(samples_path, [(
+        graph_files,
         fast_ref,
-        None
-    )])
+        fast_ref_out
+    )]))
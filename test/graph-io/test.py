@@ -0,0 +1,140 @@
+import sys, os, tempfile
+
+# appends the system path to the graph files
+sys.path.append(os.path.abspath('main'))
+sys.path.append(os.path.abspath('test'))
+
+from compact_graph import CompactGraph
+from graph import Graph
+from graph_io import IndexedGraphs, BinaryGraphs, convert_to_binary, convert_from_binary, open_graph_file, \
+    is_graph_list, load_graph, iter_graphs, read_graph_list_parallel
+from graph_iso import GraphIso
+from result_cache import ResultCache
+from test_utils import test, format_groups
+
+
+expected_path = 'test/graph-io/test_expected.txt'
+output_path = 'test/graph-io/test_actual.txt'
+samples_path = 'test/graph-io/samples/'
+graph_files = [
+    'threepaths10.gr',
+    'trees11.grl',
+    'trees11-indented.grl',
+    'torus24.grl',
+    'torus24-separated.grl',
+    'cographs1.grl',
+    'products72.grl.gz',
+]
+
+
+def edge_lists(graphs):
+    """
+    Returns the sorted neighbours of every vertex of the graphs (with the numbering of their
+    vertices), to compare graphs read in different ways.
+    """
+    lists = []
+    for graph in graphs:
+        compact = graph if isinstance(graph, CompactGraph) else CompactGraph.from_graphs([graph])
+        lists.append([sorted(compact.neighbours(v)) for v in range(compact.n)])
+    return lists
+
+
+class CountingGraph(Graph):
+    """
+    Graph that counts the edges added to it through `add_edge`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.added = 0
+
+    def add_edge(self, edge):
+        super().add_edge(edge)
+        self.added += 1
+
+
+def check(name, ok):
+    return '{} {}\n'.format(name, 'OK' if ok else 'FAILED')
+
+
+def iso_groups(graphs, cache=None):
+    groups = format_groups(graphs, GraphIso(graphs, cache).group(with_count=True))
+    return [(group.graphs, group.count) for group in groups]
+
+
+def graph_io(graphs):
+    return graphs if isinstance(graphs, list) else [graphs]
+
+
+def graph_io_out(f, graphs, graph_list):
+    path = samples_path + f
+    expected = edge_lists(graph_list)
+    output = f + '\n'
+    output += '{} graphs, {} vertices, {} edges\n'.format(len(graph_list), sum(len(g.vertices) for g in graph_list),
+                                                        sum(len(g.edges) for g in graph_list))
+
+    # parsing the graphs one by one or in slices gives the same graphs as loading them all
+    indexed = IndexedGraphs(path)
+    output += check('indexed', len(indexed) == len(graph_list)
+                    and edge_lists(indexed[i] for i in range(len(indexed))) == expected
+                    and edge_lists([indexed[-1]]) == expected[-1:])
+    output += check('slices', edge_lists(indexed[1:]) == expected[1:]
+                    and edge_lists(indexed[::2]) == expected[::2]
+                    and indexed[len(indexed):] == [])
+
+    # a graph class that overrides add_edge gets it called for every edge
+    with open_graph_file(path) as text:
+        counted = load_graph(text, CountingGraph, read_list=True)[0]
+    output += check('graph class', edge_lists(counted) == expected
+                    and all(graph.added == len(graph.edges) for graph in counted))
+
+    # reading them with a pool of processes gives the same graphs as reading them one by one
+    with open_graph_file(path) as text:
+        serial = edge_lists(iter_graphs(text))
+    with open_graph_file(path) as text:
+        loaded = edge_lists(load_graph(text, read_list=True, processes=2)[0])
+    output += check('parallel', serial == expected and loaded == expected
+                    and edge_lists(read_graph_list_parallel(Graph, path, 2)[0]) == expected
+                    and edge_lists(read_graph_list_parallel(Graph, path, 2, compact=True)[0]) == expected)
+
+    with tempfile.TemporaryDirectory() as directory:
+        binary_path = os.path.join(directory, 'graphs.bin')
+        text_path = os.path.join(directory, os.path.basename(path).replace('.gz', ''))
+
+        # the binary file has the same graphs, and so has the text file converted back from it
+        convert_to_binary(path, binary_path)
+        with BinaryGraphs(binary_path) as binary:
+            compacts = [binary[i] for i in range(len(binary))]
+            output += check('binary', edge_lists(compacts) == expected
+                            and edge_lists(binary.graph(i) for i in range(len(binary))) == expected
+                            and edge_lists([binary[-1], binary.graph(-len(binary))]) == [expected[-1], expected[0]])
+        output += check('closed', edge_lists(compacts) == expected)
+        del compacts
+
+        convert_from_binary(binary_path, text_path)
+        with open_graph_file(text_path) as text:
+            round_trip = load_graph(text, read_list=is_graph_list(text_path))
+            round_trip = round_trip[0] if is_graph_list(text_path) else [round_trip]
+        output += check('round trip', edge_lists(round_trip) == expected)
+
+        # results taken from the cache are the same as the ones computed
+        groups = iso_groups(graph_list)
+        with ResultCache(os.path.join(directory, 'results.db')) as cache:
+            stored = iso_groups(graph_list, cache)
+            cached = iso_groups(round_trip, cache)
+        output += check('cache', stored == groups and cached == groups)
+    return output
+
+
+if __name__ == '__main__':
+    f = open(expected_path, 'r')
+    expected = f.read().split('\n\n')[1:]
+    out = 'Graphs read in every way:\n\n'
+    out += test(samples_path, [(
+        graph_files,
+        graph_io,
+        graph_io_out,
+    )], expected)
+
+    with open(output_path, 'w') as f:
+        f.write(out)
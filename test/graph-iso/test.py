@@ -0,0 +1,221 @@
+import sys, os
+
+# appends the system path to the graph files
+sys.path.append(os.path.abspath('main'))
+sys.path.append(os.path.abspath('test'))
+
+from compact_graph import CompactGraph
+from graph_aut import GraphAut
+from graph_io import SharedGraphs
+from graph_iso import GraphIso, canonise, certificates_of, search_settings
+from lru_memo import LruMemo
+from termcolor import colored
+from test_utils import test, format_groups
+import graph_io
+import graph_iso as iso
+import invariants
+
+
+expected_path = 'test/graph-iso/test_expected.txt'
+output_path = 'test/graph-iso/test_actual.txt'
+samples_path = 'test/graph-iso/samples/'
+graph_files = [
+    'torus24.grl',
+    'products72.grl',
+    'cospectral.grl',
+]
+
+
+def check(name, ok):
+    return '{} {}\n'.format(name, 'OK' if ok else 'FAILED')
+
+
+def iso_groups(graphs, given=None, flags={}, **options):
+    """
+    Returns the groups and counts of the graphs (given in another way, if `given`), with the
+    given flags of graph_iso set while they are grouped.
+    """
+    saved = {name: getattr(iso, name) for name in flags}
+    try:
+        for name, value in flags.items():
+            setattr(iso, name, value)
+        groups = GraphIso(graphs if given is None else given).group(with_count=True, **options)
+    finally:
+        for name, value in saved.items():
+            setattr(iso, name, value)
+    groups = format_groups(graphs, groups)
+    return [(group.graphs, group.count) for group in groups]
+
+
+def same_automorphisms(compacts, processes):
+    """
+    Returns whether the automorphism searches run in a pool give the same groups as the
+    serial ones, and the same generators every time (whatever the timing of the workers).
+    """
+    pool = SharedGraphs.pool(processes)
+    try:
+        for compact in compacts:
+            serial = GraphAut(compact, compact.twins()).group()
+            runs = [GraphAut(compact, compact.twins()).group(pool, width)
+                    for width in (1, 1, processes + 1, processes + 1)]
+            if any(run.order() != serial.order() or sorted(run.orbits()) != sorted(serial.orbits())
+                   for run in runs) or runs[0].generators != runs[1].generators \
+                    or runs[2].generators != runs[3].generators:
+                return False
+        return True
+    finally:
+        pool.close()
+        pool.join()
+
+
+def same_groups(graphs, groups, processes):
+    """
+    Returns whether grouping and counting in a pool (a new one, or one shared by several calls)
+    gives the same groups and counts as in one process.
+    """
+    counts = [GraphIso(graphs).count(graph) for graph in graphs]
+    pool = SharedGraphs.pool(processes)
+    try:
+        return iso_groups(graphs, processes=processes) == groups \
+            and all(iso_groups(graphs, processes=processes, pool=pool) == groups for _ in range(2)) \
+            and [GraphIso(graphs).count(graph, processes, pool) for graph in graphs] == counts
+    finally:
+        pool.close()
+        pool.join()
+
+
+def attached(_):
+    return list(graph_io.attached)
+
+
+def same_shared(compacts):
+    """
+    Returns whether one worker reads two blocks of shared graphs one after the other right
+    (attached to the last one only), searches the automorphisms of two graphs right, and
+    whether all blocks are unlinked afterwards.
+    """
+    created, create = [], SharedGraphs.create
+
+    def record(compact):
+        shared = create(compact)
+        created.append(shared)
+        return shared
+
+    SharedGraphs.create = staticmethod(record)
+    pool = SharedGraphs.pool(1)
+    try:
+        ok = True
+        for order in (compacts, compacts[::-1]):
+            shared = SharedGraphs.create(CompactGraph.union(order))
+            tasks = [(shared.name, i, False, search_settings()) for i in range(len(order))]
+            canonised = [result for results, _ in pool.map(certificates_of, tasks) for result in results]
+            ok = ok and [c[:2] for c in canonised] == [canonise(c, search_settings())[:2] for c in order] \
+                and pool.map(attached, [0]) == [[shared.name]]
+            shared.close()
+            shared.unlink()
+        for compact in compacts[:2]:
+            ok = ok and GraphAut(compact).group(pool, 1).order() == GraphAut(compact).group().order()
+    finally:
+        SharedGraphs.create = staticmethod(create)
+        pool.close()
+        pool.join()
+
+    for shared in created:
+        try:
+            SharedGraphs(shared.name).close()
+            ok = False
+        except FileNotFoundError:
+            pass
+    return ok
+
+
+def same_memoised(graphs):
+    """
+    Returns whether counting the graphs again (with new GraphIso objects) takes the groups
+    of all their components from the memo, with the same counts.
+    """
+    saved = iso.memo
+    iso.memo = LruMemo(256)
+    try:
+        counts = [GraphIso(graphs).count(graph) for graph in graphs]
+        misses = iso.memo.misses
+        again = [GraphIso(graphs).count(graph) for graph in graphs]
+        return again == counts and iso.memo.misses == misses and iso.memo.hits > 0
+    finally:
+        iso.memo = saved
+
+
+def vertex_invariants(compacts, matrix_size):
+    saved = invariants.max_matrix_size
+    invariants.max_matrix_size = matrix_size
+    try:
+        return [invariants.vertex_invariants(compact) for compact in compacts]
+    finally:
+        invariants.max_matrix_size = saved
+
+
+def graph_iso(graphs):
+    return graphs
+
+
+def graph_iso_out(f, graphs, _):
+    groups = iso_groups(graphs)
+    output = f + '\n'
+    output += ''.join('{} {}\n'.format(graphs, count) for graphs, count in groups)
+
+    # the graphs can be given as a set as well
+    output += check('set', iso_groups(graphs, set(graphs)) == groups)
+
+    # starting from vertex invariants, with or without matrices, gives the same groups
+    compacts = [CompactGraph.from_graphs([graph]) for graph in graphs]
+    output += check('vertex invariants', iso_groups(graphs, flags={'use_vertex_invariants': True}) == groups
+                    and vertex_invariants(compacts, 0) == vertex_invariants(compacts, len(graphs[0].vertices)))
+
+    # searching automorphisms in a pool of processes gives the same groups
+    output += check('automorphisms in a pool', same_automorphisms(compacts, 2))
+    output += check('groups in a pool', same_groups(graphs, groups, 2))
+    output += check('shared graphs', same_shared(compacts))
+    output += check('memo', same_memoised(graphs))
+
+    # graphs with equal spectra (isomorphic or not) are never split by rounding
+    buckets = invariants.split_spectra(list(range(len(graphs))), compacts)
+    output += 'spectra {}\n'.format(sorted(sorted(bucket) for bucket in buckets))
+    return output
+
+
+def lru_memo_out():
+    output = 'LruMemo\n'
+    memo = LruMemo(2)
+    memo.put('a', 1)
+    memo.put('b', 2)
+    memo.get('a')
+    memo.put('c', 3)
+
+    # 'b' was used least recently, so it is dropped first
+    output += check('evictions', memo.get('b') is None and memo.get('a') == 1 and memo.get('c') == 3)
+    output += check('hits', (memo.hits, memo.misses) == (3, 1))
+    memo.resize(1)
+    output += check('resize', len(memo) == 1 and memo.get('c') == 3)
+    memo.resize(0)
+    memo.put('d', 4)
+    output += check('resize to 0', len(memo) == 0 and memo.get('d') is None)
+    return output
+
+
+if __name__ == '__main__':
+    f = open(expected_path, 'r')
+    expected = f.read().split('\n\n')[1:]
+    out = 'Graphs grouped in every way:\n\n'
+    out += test(samples_path, [(
+        graph_files,
+        graph_iso,
+        graph_iso_out,
+    )], expected)
+
+    block = lru_memo_out()
+    out += block + '\n'
+    print('LruMemo\t' + (colored('SUCCESS', 'green') if block in [e + '\n' for e in expected]
+                         else colored('FAILED', 'red')))
+
+    with open(output_path, 'w') as f:
+        f.write(out)
@@ -3,7 +3,7 @@ import time
 from termcolor import colored
 
 from graph import Graph, Vertex, Edge
-from graph_io import load_graph, write_dot
+from graph_io import IndexedGraphs, is_graph_list, load_graph, open_graph_file, write_dot
 
 
 def format_groups(graphs, groups):
@@ -61,11 +61,11 @@ def test(path, file_groups, expected=None):
 
 
 def test_path(path, func):
-    with open(path) as f:
+    with open_graph_file(path) as f:
 
         # load graphs from the file
         start_time = time.time()
-        is_list = path.endswith('.grl')
+        is_list = is_graph_list(path)
         graphs = load_graph(f, read_list=is_list)[0] \
             if is_list else load_graph(f)
         load_time = time.time() - start_time
@@ -78,10 +78,9 @@ def test_path(path, func):
 
 
 def save_dot_by_path(i, graphs_path, output_path):
-    with open(graphs_path) as f1:
-        graphs = load_graph(f1, read_list=True)[0]
-        with open(output_path, 'w') as f2:
-            write_dot(graphs[i], f2)
+    graph = IndexedGraphs(graphs_path)[i]
+    with open(output_path, 'w') as f:
+        write_dot(graph, f)
 
 
 def save_dot(graph, output_path):